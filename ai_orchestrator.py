@@ -1,48 +1,211 @@
 import os
-import json
+import re
+import logging
+import time
 import asyncio
+import hashlib
+import heapq
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Any, Dict, List, Optional, Tuple
 
-from proto.marshal.collections.repeated import RepeatedComposite
+import orjson
 
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-from llm_config import CENSUS_TOOL, SYSTEM_INSTRUCTION, get_variable_labels
+from config import GEOGRAPHY_HIERARCHY, STATE_FIPS_MAP
+from llm_config import SYSTEM_INSTRUCTION, get_census_tool, get_variable_labels
 from tools import (
     get_demographic_data,
     get_demographic_time_series,
-    calculate_summary_statistics,
+    calculate_class_breaks,
+    calculate_summary_statistics_batch,
+    extract_numeric_columns,
+    summarize_numeric_columns,
     refine_dashboard_data,
+    _safe_float,
 )  # TEMP: absolute import for testing
 
-load_dotenv()
-
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    print("WARNING: GOOGLE_API_KEY not found in environment variables.")
-    print("The application will not work properly without this API key.")
-    # For development/debugging, you might want to continue, but for production this should fail
-    raise ValueError("GOOGLE_API_KEY not found in environment variables. Please add it.")
-genai.configure(api_key=api_key)
+logger = logging.getLogger(__name__)
 
-model = genai.GenerativeModel(
-    model_name='gemini-2.5-flash',
-    tools=[CENSUS_TOOL],
-    system_instruction=SYSTEM_INSTRUCTION
-)
+# The Gemini SDK (grpc, protobuf, google-auth) is heavy to import, so the model is only
+# built when the first request needs it; see _get_model().
+_model: Any = None
+_RATE_LIMIT_ERRORS: Tuple[type, ...] = ()
 
+# Tool name -> (callable, is_coroutine); coroutine-ness is resolved once at registration.
 AVAILABLE_FUNCTIONS = {
-    "get_demographic_data": get_demographic_data,
-    "get_demographic_time_series": get_demographic_time_series,
-    "refine_dashboard_data": refine_dashboard_data,
+    tool.__name__: (tool, asyncio.iscoroutinefunction(tool))
+    for tool in (get_demographic_data, get_demographic_time_series, refine_dashboard_data)
+}
+
+# Dedicated, bounded pool for synchronous tools so they never queue behind other work
+# sharing the event loop's default executor. Created on first use so it survives a restart.
+TOOL_POOL_SIZE = int(os.getenv("TOOL_POOL_SIZE", "16"))
+_tool_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    global _tool_executor
+    if _tool_executor is None:
+        _tool_executor = ThreadPoolExecutor(max_workers=TOOL_POOL_SIZE, thread_name_prefix="census-tool")
+    return _tool_executor
+
+
+def shutdown_tool_executor() -> None:
+    """Shut the tool pool down; call on application shutdown."""
+    global _tool_executor
+    if _tool_executor is not None:
+        _tool_executor.shutdown(wait=False, cancel_futures=True)
+        _tool_executor = None
+
+
+# Built once at import and shared by every response; treat as read-only. It stays a plain
+# dict (not a MappingProxyType) because it is embedded in payloads that orjson encodes.
+_VARIABLE_LABELS = get_variable_labels()
+# One {"id", "name"} entry per known variable, reused by every dashboard's available_variables.
+_VARIABLE_ENTRIES: Dict[str, Dict[str, str]] = {
+    key: {"id": key, "name": label} for key, label in _VARIABLE_LABELS.items()
 }
+_RESPONSE_CACHE: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_CHAT_SESSIONS: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+_CHAT_SESSION_LOCKS: Dict[str, asyncio.Lock] = {}
 
 DEFAULT_HISTORY_LIMIT = int(os.getenv("LLM_HISTORY_LIMIT", "6"))
-NON_VALUE_KEYS = {"state", "county", "tract", "place", "zip code tabulation area"}
-MAP_TOOL_HINT = "Hint: Use the get_demographic_data tool when answering geographic visualization questions."
-TIME_SERIES_TOOL_HINT = "Hint: Use the get_demographic_time_series tool when users ask about change over time or trends."
-REFINEMENT_TOOL_HINT = "Hint: When adjusting the current dashboard view, prefer refine_dashboard_data to reuse existing results before calling Census APIs again."
+HISTORY_ANCHOR_EVERY = int(os.getenv("LLM_HISTORY_ANCHOR_EVERY", "4"))
+HISTORY_DIGEST_MAX_CHARS = 200
+# Rough cap (about four characters per token) on the verbatim turns resent with each request.
+HISTORY_TOKEN_BUDGET = int(os.getenv("LLM_HISTORY_TOKEN_BUDGET", "3000"))
+DASHBOARD_OFFLOAD_MIN_ROWS = int(os.getenv("DASHBOARD_OFFLOAD_MIN_ROWS", "1000"))
+SKIP_INTERPRETATION = os.getenv("LLM_SKIP_INTERPRETATION", "false").lower() in {"1", "true", "yes"}
+SKIP_INTERPRETATION_MAX_ROWS = int(os.getenv("LLM_SKIP_INTERPRETATION_MAX_ROWS", "5"))
+RESPONSE_CACHE_SIZE = int(os.getenv("LLM_RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_HISTORY = int(os.getenv("LLM_RESPONSE_CACHE_MAX_HISTORY", "4"))
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("LLM_CHAT_SESSION_TTL_SECONDS", "1800"))
+CHAT_SESSION_MAX = int(os.getenv("LLM_CHAT_SESSION_MAX", "1024"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "1.0"))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "20"))
+_BATCH_SEMAPHORE = asyncio.Semaphore(GEMINI_CONCURRENCY)
+# Geography identifier columns the Census API can return, plus NAME: never data values.
+NON_VALUE_KEYS = frozenset(
+    {"NAME", "block group"} | {spec["api_name"] for spec in GEOGRAPHY_HIERARCHY.values()}
+)
+
+
+def _keyword_alternation(keywords: Sequence[str]) -> str:
+    """Join literal keywords into a regex alternation that tolerates any whitespace run between words."""
+    return "|".join(re.escape(keyword).replace(r"\ ", r"\s+") for keyword in keywords)
+
+
+MAP_KEYWORDS = ('map', 'show me', 'display', 'visualize', 'chart', 'counties', 'states', 'income', 'population', 'demographic')
+# Substring semantics are kept on purpose ("maps", "charting" still count).
+MAP_KEYWORDS_RE = re.compile(_keyword_alternation(MAP_KEYWORDS), re.IGNORECASE)
+TIME_SERIES_KEYWORDS = (
+    "over time",
+    "time series",
+    "trend",
+    "since ",
+    "year over year",
+    "year-by-year",
+    "historical",
+    "change from",
+    "changes from",
+    "growth from",
+    "growth since",
+    "timeline",
+)
+TIME_SERIES_KEYWORDS_RE = re.compile(_keyword_alternation(TIME_SERIES_KEYWORDS), re.IGNORECASE)
+# Whitespace-delimited 19xx/20xx tokens, matching the previous split()-based year scan.
+YEAR_TOKEN_RE = re.compile(r"(?<!\S)(?:19|20)\d{2}(?!\S)")
+# Both intents in one scan for the request path. No map keyword and time-series keyword can
+# match at the same position, but run-together input ("chartrend") can make matches overlap,
+# so detect_intents resumes each search one character past the previous match's start.
+INTENT_RE = re.compile(
+    f"(?P<map>{MAP_KEYWORDS_RE.pattern})"
+    f"|(?P<time_series>{TIME_SERIES_KEYWORDS_RE.pattern})"
+    f"|(?P<year>{YEAR_TOKEN_RE.pattern})",
+    re.IGNORECASE,
+)
+FORCE_TOOL_CALLS = os.getenv("LLM_FORCE_TOOL_CALLS", "true").lower() in {"1", "true", "yes"}
+# Explicit requests to draw something always need Census data, so require a function call for
+# them. The broader map keywords ("income", "states") also appear in conceptual questions that
+# deserve a text answer, so they alone never force a tool call.
+FORCE_TOOL_VERBS_RE = re.compile(
+    r"\b(?:maps?|mapping|charts?|charting|plot|graph|visuali[sz]e|display|show\s+me)\b",
+    re.IGNORECASE,
+)
+FORCED_TOOL_CONFIG = {"function_calling_config": {"mode": "ANY"}}
+DIRECT_QUERY_ROUTING = os.getenv("LLM_DIRECT_QUERY_ROUTING", "true").lower() in {"1", "true", "yes"}
+# Phrases for stereotyped "<metric> by <geography>" questions that can be answered with a
+# single known tool call, mapped to CENSUS_VARIABLE_MAP keys.
+DIRECT_QUERY_METRICS = {
+    "population": "total_population",
+    "median age": "median_age",
+    "median household income": "median_household_income",
+    "per capita income": "per_capita_income",
+    "median home value": "median_home_value",
+    "median gross rent": "median_gross_rent",
+}
+_DIRECT_QUERY_SUBJECT = (
+    r"(?P<metric>"
+    + _keyword_alternation(sorted(DIRECT_QUERY_METRICS, key=len, reverse=True))
+    + r")\s+by\s+(?P<geography>states?|count(?:y|ies))"
+)
+DIRECT_QUERY_RE = re.compile(
+    r"^\s*(?:(?:show(?:\s+me)?|map|display|visualize)\s+)?(?:the\s+)?"
+    + _DIRECT_QUERY_SUBJECT
+    + r"(?:\s+in\s+(?P<state>[a-z][a-z .]*?))?\s*[?.!]*\s*$",
+    re.IGNORECASE,
+)
+SPECULATIVE_TOOL_CALLS = os.getenv("LLM_SPECULATIVE_TOOL_CALLS", "true").lower() in {"1", "true", "yes"}
+# The same "<metric> by <geography>" phrase found anywhere in a longer query. Such queries
+# still go to the model, but their likely tool call is started while the model decides.
+SPECULATIVE_QUERY_RE = re.compile(
+    r"\b" + _DIRECT_QUERY_SUBJECT + r"\b(?:\s+in\s+(?P<state>[a-z][a-z ]*))?",
+    re.IGNORECASE,
+)
+
+
+def _get_model() -> Any:
+    global _model, _RATE_LIMIT_ERRORS
+    if _model is not None:
+        return _model
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        logger.warning("GOOGLE_API_KEY not found in environment variables. The application will not work properly without this API key.")
+        raise ValueError("GOOGLE_API_KEY not found in environment variables. Please add it.")
+
+    import google.generativeai as genai
+    from google.api_core.exceptions import ResourceExhausted
+
+    genai.configure(api_key=api_key)
+    _RATE_LIMIT_ERRORS = (ResourceExhausted,)
+    _model = genai.GenerativeModel(
+        model_name='gemini-2.5-flash',
+        tools=[get_census_tool()],
+        system_instruction=SYSTEM_INSTRUCTION
+    )
+    return _model
+
+
+def _build_token_usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _text_response(text: str, prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+    return {"response": text, "token_usage": _build_token_usage(prompt_tokens, completion_tokens)}
 
 
 def _build_context_summary(context: Dict[str, Any]) -> str:
@@ -78,80 +241,270 @@ def _build_context_summary(context: Dict[str, Any]) -> str:
 
 def _normalize_tool_value(value: Any) -> Any:
     """Convert protobuf marshalled values into plain Python types for tool execution."""
-    if isinstance(value, RepeatedComposite):
-        return [_normalize_tool_value(item) for item in list(value)]
-    if isinstance(value, dict):
+    # Leaves are plain str/float (Struct numbers always arrive as float); settle them before
+    # the slower ABC checks below.
+    value_type = type(value)
+    if value_type is str:
+        return value
+    if value_type is float:
+        return int(value) if value.is_integer() else value
+    if value_type is list and all(type(item) is str for item in value):
+        # Lists of variable codes are the common case and have nothing to convert.
+        return value
+    # proto MapComposite / RepeatedComposite are Mapping / Sequence, so no SDK import is needed.
+    if isinstance(value, Mapping):
         return {key: _normalize_tool_value(val) for key, val in value.items()}
-    if isinstance(value, (list, tuple)):
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
         return [_normalize_tool_value(item) for item in value]
     if isinstance(value, float) and value.is_integer():
         return int(value)
     return value
 
 
-def _normalize_tool_args(raw_args: Dict[str, Any]) -> Dict[str, Any]:
+_JSON_SCALAR_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
+def _is_json_native(value: Any) -> bool:
+    """Check that a value only contains JSON-native Python types, without copying it.
+
+    Walks with an explicit stack and bails on the first foreign type. Exact type checks
+    keep the per-cell cost low; subclasses simply take the slower conversion path.
+    """
+    stack = [value]
+    while stack:
+        current = stack.pop()
+        current_type = type(current)
+        if current_type in _JSON_SCALAR_TYPES:
+            continue
+        if current_type is dict:
+            for key, item in current.items():
+                if type(key) is not str:
+                    return False
+                if type(item) not in _JSON_SCALAR_TYPES:
+                    stack.append(item)
+        elif current_type is list:
+            stack.extend(item for item in current if type(item) not in _JSON_SCALAR_TYPES)
+        else:
+            return False
+    return True
+
+
+def _normalize_tool_args(raw_args: Mapping[str, Any]) -> Dict[str, Any]:
+    """Build plain tool kwargs from an args mapping (plain dicts or proto MapComposite alike)."""
     return {key: _normalize_tool_value(value) for key, value in raw_args.items()}
 
 
-def truncate_history(history: List[Dict[str, Any]] | None, max_messages: int = DEFAULT_HISTORY_LIMIT) -> List[Dict[str, Any]]:
-    """Return only the most recent chat messages to keep prompt size small."""
+def _function_call_args(function_call: Any) -> Dict[str, Any]:
+    """Convert a FunctionCall's args Struct to tool kwargs.
+
+    protobuf's MessageToDict converts the whole Struct in one native pass, which is
+    several times faster than walking the proto-plus MapComposite item by item; the
+    result only needs its integer-valued floats settled.
+    """
+    from google.protobuf.json_format import MessageToDict  # loaded with the SDK by now
+
+    return _normalize_tool_args(MessageToDict(type(function_call).pb(function_call).args))
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    texts: List[str] = []
+    for part in message.get("parts") or []:
+        if isinstance(part, str):
+            texts.append(part)
+        elif isinstance(part, dict) and isinstance(part.get("text"), str):
+            texts.append(part["text"])
+    return " ".join(" ".join(texts).split())
+
+
+def compress_history(
+    history: List[Dict[str, Any]],
+    keep_last: int = DEFAULT_HISTORY_LIMIT,
+    anchor_every: int = HISTORY_ANCHOR_EVERY,
+) -> List[Dict[str, Any]]:
+    """Keep the latest turns verbatim and fold older turns into one synthetic context turn.
+
+    Every ``anchor_every``-th older user turn is quoted as-is; the remaining older turns are
+    reduced to a short role-prefixed digest. No model call is made.
+    """
+    if keep_last <= 0:
+        return []
+    if len(history) <= keep_last:
+        return list(history)
+
+    older, recent = history[:-keep_last], history[-keep_last:]
+    anchors: List[str] = []
+    digest_parts: List[str] = []
+    user_turn_index = 0
+    for message in older:
+        text = _message_text(message)
+        if not text:
+            continue
+        role = message.get("role", "user")
+        if role == "user":
+            if anchor_every > 0 and user_turn_index % anchor_every == 0:
+                anchors.append(text)
+                user_turn_index += 1
+                continue
+            user_turn_index += 1
+        digest_parts.append(f"{role}: {text}")
+
+    summary_lines = ["Context from earlier in this conversation."]
+    if anchors:
+        summary_lines.append("Earlier user requests: " + " | ".join(anchors))
+    digest = " | ".join(digest_parts)
+    if digest:
+        if len(digest) > HISTORY_DIGEST_MAX_CHARS:
+            digest = digest[: HISTORY_DIGEST_MAX_CHARS - 3].rstrip() + "..."
+        summary_lines.append(f"Other turns: {digest}")
+
+    return [
+        {"role": "user", "parts": ["\n".join(summary_lines)]},
+        {"role": "model", "parts": ["Understood."]},
+    ] + list(recent)
+
+
+def _estimate_tokens(message: Dict[str, Any]) -> int:
+    chars = 0
+    for part in message.get("parts") or []:
+        if isinstance(part, str):
+            chars += len(part)
+        elif isinstance(part, dict) and isinstance(part.get("text"), str):
+            chars += len(part["text"])
+    return chars // 4 + 1
+
+
+def _fit_token_budget(messages: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """Drop the oldest messages until the estimate fits the budget; the newest is always kept."""
+    if token_budget <= 0:
+        return messages
+    total = 0
+    for index in range(len(messages) - 1, -1, -1):
+        total += _estimate_tokens(messages[index])
+        if total > token_budget:
+            return messages[min(index + 1, len(messages) - 1):]
+    return messages
+
+
+def truncate_history(
+    history: List[Dict[str, Any]] | None,
+    max_messages: int = DEFAULT_HISTORY_LIMIT,
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+) -> List[Dict[str, Any]]:
+    """Return the most recent chat messages, compressing long sessions to keep prompt size small.
+
+    The verbatim turns are also held to ``token_budget`` so one long earlier answer cannot
+    inflate every later prompt.
+    """
     if not history:
         return []
-    return history[-max_messages:]
+    if len(history) > 2 * max_messages:
+        compressed = compress_history(history, keep_last=max_messages)
+        # The first two entries are the synthetic context turn and its acknowledgement.
+        return compressed[:2] + _fit_token_budget(compressed[2:], token_budget)
+    return _fit_token_budget(history[-max_messages:], token_budget)
 
 
 def build_query_prompt(
     user_query: str,
-    is_map_request: bool,
-    is_time_series_request: bool,
     conversation_context: Optional[Dict[str, Any]] = None,
 ) -> str:
-    """Append context and lightweight hints for map, time-series, or refinement requests."""
+    """Prefix the query with a summary of the current dashboard when continuing a conversation.
+
+    Tool guidance lives in the model's system instruction, so it is not repeated here.
+    """
+
+    if not conversation_context:
+        return user_query
 
-    prompt_prefix = user_query
-    hints: List[str] = []
+    context_summary = _build_context_summary(conversation_context)
+    context_intro = "The user is continuing a conversation."
+    if context_summary:
+        context_intro = f"{context_intro} {context_summary}"
+    return f"{context_intro}\n\nNew request: {user_query}"
 
-    if conversation_context:
-        context_summary = _build_context_summary(conversation_context)
-        context_intro = "The user is continuing a conversation."
-        if context_summary:
-            context_intro = f"{context_intro} {context_summary}"
-        prompt_prefix = f"{context_intro}\n\nNew request: {user_query}"
-        hints.append(REFINEMENT_TOOL_HINT)
 
-    if is_map_request:
-        hints.append(MAP_TOOL_HINT)
-    if is_time_series_request:
-        hints.append(TIME_SERIES_TOOL_HINT)
-    if hints:
-        return f"{prompt_prefix}\n\n" + "\n".join(hints)
-    return prompt_prefix
+def detect_map_request(user_query: str) -> bool:
+    """Heuristically determine if the query asks for a map or comparative visualization."""
+    return MAP_KEYWORDS_RE.search(user_query) is not None
 
 
 def detect_time_series_request(user_query: str) -> bool:
     """Heuristically determine if the query is asking about change over time or trends."""
-    query_lower = user_query.lower()
-    time_keywords = [
-        "over time",
-        "time series",
-        "trend",
-        "since ",
-        "year over year",
-        "year-by-year",
-        "historical",
-        "change from",
-        "changes from",
-        "growth from",
-        "growth since",
-        "timeline",
-    ]
-    if any(keyword in query_lower for keyword in time_keywords):
+    if TIME_SERIES_KEYWORDS_RE.search(user_query):
         return True
 
     # Look for multiple year references (e.g., 2010 and 2020) to infer a range
-    years_found = [token for token in query_lower.split() if token.isdigit() and len(token) == 4]
-    unique_years = {year for year in years_found if year.startswith("19") or year.startswith("20")}
-    return len(unique_years) >= 2
+    return len(set(YEAR_TOKEN_RE.findall(user_query))) >= 2
+
+
+def detect_intents(user_query: str) -> Tuple[bool, bool]:
+    """Return (is_map_request, is_time_series_request) from a single scan of the query."""
+    is_map_request = has_time_keyword = False
+    years = set()
+    match = INTENT_RE.search(user_query)
+    while match is not None:
+        intent = match.lastgroup
+        if intent == "map":
+            is_map_request = True
+        elif intent == "time_series":
+            has_time_keyword = True
+        else:
+            years.add(match.group())
+        if is_map_request and (has_time_keyword or len(years) >= 2):
+            break
+        match = INTENT_RE.search(user_query, match.start() + 1)
+    return is_map_request, has_time_keyword or len(years) >= 2
+
+
+def _direct_query_args(metric: str, geography: str, state_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    variable = DIRECT_QUERY_METRICS[" ".join(metric.lower().split())]
+    if geography.lower().startswith("state"):
+        # "population by state in Texas" is not a per-state breakdown; let the model decide.
+        if state_name is not None:
+            return None
+        return {"geography_level": "state", "variables": [variable]}
+    if state_name is None:
+        return None
+    return {"geography_level": "county", "variables": [variable], "state_name": state_name}
+
+
+def match_direct_query(user_query: str) -> Optional[Dict[str, Any]]:
+    """Return get_demographic_data args for queries that need no LLM routing, else None."""
+    match = DIRECT_QUERY_RE.match(user_query)
+    if not match:
+        return None
+
+    state_name = " ".join(match.group("state").lower().split()) if match.group("state") else None
+    if state_name is not None and state_name not in STATE_FIPS_MAP:
+        return None
+    return _direct_query_args(match.group("metric"), match.group("geography"), state_name)
+
+
+def guess_tool_args(user_query: str) -> Optional[Dict[str, Any]]:
+    """Guess get_demographic_data args from a "<metric> by <geography>" phrase anywhere in the query."""
+    match = SPECULATIVE_QUERY_RE.search(user_query)
+    if not match:
+        return None
+
+    state_name = None
+    if match.group("state"):
+        # The phrase may run on past the state ("in new york over the years"), so take the
+        # longest leading run of words that names a state.
+        words = match.group("state").lower().split()
+        candidates = (" ".join(words[:count]) for count in range(len(words), 0, -1))
+        state_name = next((candidate for candidate in candidates if candidate in STATE_FIPS_MAP), None)
+        if state_name is None:
+            return None
+    return _direct_query_args(match.group("metric"), match.group("geography"), state_name)
+
+
+def _is_guessed_request(args: Dict[str, Any], guessed_args: Dict[str, Any]) -> bool:
+    """Check whether the model's get_demographic_data args ask for the guessed request."""
+    present = {key: value for key, value in args.items() if value not in (None, "", [])}
+    for key in ("geography_level", "state_name"):
+        if isinstance(present.get(key), str):
+            present[key] = " ".join(present[key].lower().split())
+    return present == guessed_args
 
 
 def summarize_tool_result(data: Any, args: Dict[str, Any], top_n: int = 5) -> Dict[str, Any]:
@@ -168,41 +521,36 @@ def summarize_tool_result(data: Any, args: Dict[str, Any], top_n: int = 5) -> Di
         }
 
     fields = [str(key) for key in data[0].keys()]
+    # Tool rows share one schema, so decide the value columns once from the first row.
+    value_fields = [key for key in data[0] if key not in NON_VALUE_KEYS]
     samples: List[Dict[str, Any]] = []
     for item in data[:top_n]:
-        sample: Dict[str, Any] = {}
-        if "NAME" in item:
-            sample["NAME"] = item["NAME"]
-        for key, value in item.items():
-            if key in NON_VALUE_KEYS or key == "NAME":
-                continue
-            if isinstance(value, (int, float, str)):
-                sample[key] = value
+        sample: Dict[str, Any] = {"NAME": item["NAME"]} if "NAME" in item else {}
+        sample.update({
+            key: item[key]
+            for key in value_fields
+            if isinstance(item.get(key), (int, float, str))
+        })
         samples.append(sample)
 
+    summary: Dict[str, Any] = {
+        "total_records": len(data),
+        "geography_level": args.get("geography_level"),
+        "variables": args.get("variables"),
+        "derived_metrics": args.get("derived_metrics"),
+        "fields": fields,
+    }
+    if len(data) > top_n:
+        # The samples only cover a few rows, so give the model whole-result statistics
+        # (including where the extremes are) instead of sending more rows.
+        summary["statistics"] = calculate_summary_statistics_batch(data, value_fields)
+
     return {
-        "summary": {
-            "total_records": len(data),
-            "geography_level": args.get("geography_level"),
-            "variables": args.get("variables"),
-            "derived_metrics": args.get("derived_metrics"),
-            "fields": fields,
-        },
+        "summary": summary,
         "samples": samples,
     }
 
 
-def _safe_float(value: Any) -> float | None:
-    try:
-        if isinstance(value, (int, float)):
-            return float(value)
-        if isinstance(value, str) and value.strip():
-            return float(value.replace(",", ""))
-    except ValueError:
-        return None
-    return None
-
-
 def _format_value(value: float | None) -> str:
     if value is None:
         return "N/A"
@@ -217,21 +565,23 @@ def _format_value(value: float | None) -> str:
 
 def generate_basic_insights(data: List[Dict[str, Any]], variable_id: str, variable_label: str) -> List[str]:
     """Create lightweight insights without a second LLM round-trip."""
-    numeric_rows: List[Tuple[float, str]] = []
-    for row in data:
-        value = _safe_float(row.get(variable_id))
-        if value is None:
-            continue
-        numeric_rows.append((value, row.get("NAME", "Unknown")))
+    column = [_safe_float(row.get(variable_id)) for row in data]
+    names = [row.get("NAME", "Unknown") for row in data]
+    return generate_column_insights(column, names, variable_label)
+
 
-    if not numeric_rows:
+def generate_column_insights(column: List[Optional[float]], names: List[str], variable_label: str) -> List[str]:
+    """Create insights from an already-parsed value column aligned with ``names``."""
+    present = [index for index, value in enumerate(column) if value is not None]
+    if not present:
         return []
 
-    numeric_rows.sort()
-    min_value, min_name = numeric_rows[0]
-    max_value, max_name = numeric_rows[-1]
-    mid = len(numeric_rows) // 2
-    median_value, median_name = numeric_rows[mid]
+    # Order indices by value only; comparing (value, name) tuples is markedly slower on large results.
+    order = sorted(present, key=column.__getitem__)
+    min_value, min_name = column[order[0]], names[order[0]]
+    max_value, max_name = column[order[-1]], names[order[-1]]
+    median_index = order[len(order) // 2]
+    median_value, median_name = column[median_index], names[median_index]
 
     spread = max_value - min_value
     insights = [
@@ -239,7 +589,7 @@ def generate_basic_insights(data: List[Dict[str, Any]], variable_id: str, variab
         f"{min_name} has the lowest {variable_label} at {_format_value(min_value)}.",
     ]
 
-    if len(numeric_rows) > 2:
+    if len(present) > 2:
         insights.append(
             f"Median entity ({median_name}) sits at {_format_value(median_value)}, showing overall spread of {_format_value(spread)}."
         )
@@ -247,6 +597,135 @@ def generate_basic_insights(data: List[Dict[str, Any]], variable_id: str, variab
     return insights
 
 
+def build_heuristic_answer(summarized_content: Dict[str, Any], variable_labels: Dict[str, str]) -> Optional[str]:
+    """Describe a small summarized tool result in plain text so the interpretation call can be skipped."""
+    samples = summarized_content.get("samples") or []
+    lines: List[str] = []
+    for sample in samples:
+        described_values: List[str] = []
+        for key, value in sample.items():
+            if key == "NAME":
+                continue
+            numeric_value = _safe_float(value)
+            if numeric_value is None:
+                continue
+            described_values.append(f"{variable_labels.get(key, key)}: {_format_value(numeric_value)}")
+        if described_values:
+            lines.append(f"{sample.get('NAME', 'Result')} — " + ", ".join(described_values))
+
+    if not lines:
+        return None
+
+    total_records = summarized_content.get("summary", {}).get("total_records", len(samples))
+    if total_records > len(samples):
+        lines.append(f"Showing {len(samples)} of {total_records} results.")
+    return "\n".join(lines)
+
+
+def build_dashboard_response(
+    data_items: List[Dict[str, Any]],
+    args: Dict[str, Any],
+    total_prompt_tokens: int,
+    total_completion_tokens: int,
+) -> Optional[Dict[str, Any]]:
+    """Build the structured dashboard payload for a single-year tool result.
+
+    Returns None when no displayable variable can be found so the caller can fall
+    back to an LLM interpretation.
+    """
+    variable_labels = _VARIABLE_LABELS
+
+    # Walk the sample row once: its value keys drive both the display variable and the
+    # list of available variables.
+    sample_item = data_items[0]
+    value_keys = [key for key in sample_item if key not in NON_VALUE_KEYS]
+    present_keys = set(value_keys)
+
+    # Prioritize derived metrics, then regular variables, then any non-geographic variable
+    requested_keys = list(args.get("derived_metrics") or []) + list(args.get("variables") or [])
+    display_variable_id = next(
+        (key for key in requested_keys if key in present_keys),
+        value_keys[0] if value_keys else None,
+    )
+
+    logger.debug("Found display_variable_id: %s", display_variable_id)
+
+    if not display_variable_id:
+        return None
+
+    # 1. Get all variables present in the data
+    all_variables = [_VARIABLE_ENTRIES[key] for key in value_keys if key in _VARIABLE_ENTRIES]
+
+    # 2. Parse every numeric column once; statistics, chart and insights all read from it
+    variable_ids = [item["id"] for item in all_variables]
+    if display_variable_id not in variable_ids:
+        variable_ids.append(display_variable_id)
+    columns = extract_numeric_columns(data_items, variable_ids)
+    names = [item.get("NAME", "Unknown") for item in data_items]
+    display_column = columns[display_variable_id]
+    summary_statistics = summarize_numeric_columns(
+        {item["id"]: columns[item["id"]] for item in all_variables},
+        names,
+    )
+
+    # 3. Prepare chart data (Top 5 entities by display variable)
+    chart_data = []
+    available_variable_ids = {item["id"] for item in all_variables}
+    if display_variable_id in available_variable_ids:
+        # Rows without a parseable value are left out rather than charted as 0.
+        present_indices = [index for index, value in enumerate(display_column) if value is not None]
+        top_indices = heapq.nlargest(5, present_indices, key=display_column.__getitem__)
+        chart_data = [
+            {"name": names[index], "value": display_column[index]}
+            for index in top_indices
+        ]
+
+    charts = [{
+        "chart_type": "bar_chart",
+        "title": f"Top 5 {args.get('geography_level', 'entities').title()} by {variable_labels.get(display_variable_id, display_variable_id)}",
+        "variable_id": display_variable_id,
+        "data": chart_data
+    }] if chart_data else []
+
+    # 4. Generate heuristic insights without extra LLM calls
+    variable_label = variable_labels.get(display_variable_id, display_variable_id)
+    insights = generate_column_insights(display_column, names, variable_label)
+    if insights:
+        summary_text = f"Analysis of {variable_label} across {len(data_items)} {args.get('geography_level', 'entities')}"
+    else:
+        summary_text = f"No {variable_label} values were reported for the requested {args.get('geography_level', 'entities')}"
+
+    # 5. Ensure data is JSON serializable (Census rows normally already are)
+    if _is_json_native(data_items):
+        serializable_data = data_items
+    else:
+        serializable_data = orjson.loads(orjson.dumps(data_items, default=str, option=orjson.OPT_NON_STR_KEYS))
+
+    state_name_arg = args.get("state_name")
+    state_value = sample_item.get("state")
+    state_fips_value = str(state_value).zfill(2) if state_value is not None else None
+
+    # 6. Construct dashboard response
+    return {
+        "type": "dashboard_data",
+        "summary_text": summary_text,
+        "data": serializable_data,
+        "metadata": {
+            "geography_level": str(args.get("geography_level", "")),
+            "display_variable_id": str(display_variable_id),
+            "class_breaks": calculate_class_breaks(display_column),
+            "variable_labels": variable_labels,
+            "available_variables": all_variables,
+            "state_name": state_name_arg,
+            "state_fips": state_fips_value,
+        },
+        "charts": charts,
+        "summary_statistics": summary_statistics,
+        "insights": insights,
+        "token_usage": _build_token_usage(total_prompt_tokens, total_completion_tokens)
+    }
+
+
 def build_time_series_dashboard(
     tool_result: Dict[str, Any],
     args: Dict[str, Any],
@@ -254,31 +733,25 @@ def build_time_series_dashboard(
     total_completion_tokens: int,
 ) -> Dict[str, Any]:
     if not isinstance(tool_result, dict):
-        return {
-            "response": "Sorry, the time-series tool did not return structured data.",
-            "token_usage": {
-                "prompt_tokens": total_prompt_tokens,
-                "completion_tokens": total_completion_tokens,
-                "total_tokens": total_prompt_tokens + total_completion_tokens,
-            },
-        }
+        return _text_response(
+            "Sorry, the time-series tool did not return structured data.",
+            total_prompt_tokens,
+            total_completion_tokens,
+        )
 
     if "error" in tool_result:
-        return {
-            "response": tool_result.get("error", "Time-series tool reported an error."),
-            "token_usage": {
-                "prompt_tokens": total_prompt_tokens,
-                "completion_tokens": total_completion_tokens,
-                "total_tokens": total_prompt_tokens + total_completion_tokens,
-            },
-        }
+        return _text_response(
+            tool_result.get("error", "Time-series tool reported an error."),
+            total_prompt_tokens,
+            total_completion_tokens,
+        )
 
     data = tool_result.get("data", [])
     metadata = dict(tool_result.get("metadata", {}))
     series = tool_result.get("series", [])
     metrics = tool_result.get("metrics", {})
 
-    variable_labels = get_variable_labels()
+    variable_labels = _VARIABLE_LABELS
     primary_code = metadata.get("primary_variable_code")
 
     fallback_label = None
@@ -304,14 +777,14 @@ def build_time_series_dashboard(
         label_keys.append(primary_code)
 
     metadata_labels: Dict[str, str] = metadata.get("variable_labels", {}) or {}
-    for key in label_keys:
-        if not key:
+    # primary_code usually repeats a requested variable's code, so visit each key once.
+    for key in dict.fromkeys(label_keys):
+        if not key or key in metadata_labels:
             continue
-        if key not in metadata_labels:
-            label_value = variable_labels.get(key)
-            if not label_value and isinstance(key, str):
-                label_value = key.replace("_", " ").title()
-            metadata_labels[key] = label_value or str(key)
+        label_value = variable_labels.get(key)
+        if not label_value and isinstance(key, str):
+            label_value = key.replace("_", " ").title()
+        metadata_labels[key] = label_value or str(key)
 
     metadata.setdefault("primary_variable_code", primary_code)
     metadata["primary_variable_label"] = metadata_labels.get(primary_code, variable_label)
@@ -348,7 +821,7 @@ def build_time_series_dashboard(
         except (TypeError, ValueError):
             return float("-inf")
 
-    top_series = sorted(series, key=_series_sort_key, reverse=True)[:10]
+    top_series = heapq.nlargest(10, series, key=_series_sort_key)
 
     chart_series = []
     for entry in top_series:
@@ -381,43 +854,453 @@ def build_time_series_dashboard(
 
     errors = tool_result.get("errors", {})
 
-    try:
-        serializable_data = json.loads(json.dumps({
-            "data": data,
-            "series": series,
-            "metadata": metadata,
-            "metrics": metrics,
-            "errors": errors,
-        }))
-    except TypeError:
-        serializable_data = {
-            "data": data,
-            "series": series,
-            "metadata": metadata,
-            "metrics": metrics,
-            "errors": errors,
-        }
-
     return {
         "type": "time_series_dashboard",
         "summary_text": summary_text,
-        "data": serializable_data.get("data", data),
-        "series": serializable_data.get("series", series),
+        "data": data,
+        "series": series,
         "charts": charts,
-        "metrics": serializable_data.get("metrics", metrics),
-        "metadata": serializable_data.get("metadata", metadata),
-        "errors": serializable_data.get("errors", errors),
+        "metrics": metrics,
+        "metadata": metadata,
+        "errors": errors,
         "insights": insights,
-        "token_usage": {
-            "prompt_tokens": total_prompt_tokens,
-            "completion_tokens": total_completion_tokens,
-            "total_tokens": total_prompt_tokens + total_completion_tokens,
+        "token_usage": _build_token_usage(total_prompt_tokens, total_completion_tokens),
+    }
+
+
+async def _run_dashboard_builder(builder: Any, row_count: int, *builder_args: Any) -> Any:
+    """Run a dashboard builder, moving large payloads off the event loop thread.
+
+    The builders are pure-Python aggregation; for big results running them on the tool
+    pool keeps other in-flight requests responsive while this one is assembled.
+    """
+    if row_count >= DASHBOARD_OFFLOAD_MIN_ROWS:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_tool_executor(), partial(builder, *builder_args))
+    return builder(*builder_args)
+
+
+async def _send_message_with_retry(chat_session: Any, content: Any, **kwargs: Any) -> Any:
+    """Send a chat message, backing off exponentially when Gemini reports rate limiting."""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return await chat_session.send_message_async(content, **kwargs)
+        except _RATE_LIMIT_ERRORS:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = LLM_RETRY_BASE_DELAY_SECONDS * (2 ** attempt)
+            logger.warning("Gemini rate limit hit, retrying in %.1fs (attempt %d/%d)", delay, attempt + 1, LLM_MAX_RETRIES)
+            await asyncio.sleep(delay)
+
+
+async def _stream_chat_text(chat_session: Any, content: Any) -> Tuple[str, bool, Any]:
+    """Send a chat message with streaming enabled and accumulate text parts as they decode.
+
+    Returns the joined text, whether any candidate content arrived, and the usage metadata
+    reported with the final chunk.
+    """
+    streamed_response = await _send_message_with_retry(chat_session, content, stream=True)
+    text_chunks: List[str] = []
+    has_candidates = False
+    async for chunk in streamed_response:
+        chunk_candidates = chunk.candidates
+        if not chunk_candidates:
+            continue
+        has_candidates = True
+        for part in chunk_candidates[0].content.parts:
+            if part.text:
+                text_chunks.append(part.text)
+    return "".join(text_chunks), has_candidates, streamed_response.usage_metadata
+
+
+def _response_cache_key(
+    user_query: str,
+    trimmed_history: List[Dict[str, Any]],
+    conversation_context: Optional[Dict[str, Any]],
+) -> str:
+    key_payload = orjson.dumps(
+        {
+            "query": " ".join(user_query.lower().split()),
+            "history": trimmed_history,
+            "context": conversation_context or {},
         },
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+        default=str,
+    )
+    return hashlib.blake2b(key_payload, digest_size=16).hexdigest()
+
+
+def _get_cached_response(cache_key: str) -> Optional[Dict[str, Any]]:
+    cached = _RESPONSE_CACHE.get(cache_key)
+    if cached is None:
+        return None
+    stored_at, cached_response = cached
+    if time.monotonic() - stored_at > RESPONSE_CACHE_TTL_SECONDS:
+        _RESPONSE_CACHE.pop(cache_key, None)
+        return None
+    _RESPONSE_CACHE.move_to_end(cache_key)
+    # No model call was made for this answer, so report zero token usage.
+    return {
+        **cached_response,
+        "token_usage": _build_token_usage(0, 0),
     }
+
+
+def _store_cached_response(cache_key: str, response: Dict[str, Any]) -> None:
+    _RESPONSE_CACHE[cache_key] = (time.monotonic(), response)
+    _RESPONSE_CACHE.move_to_end(cache_key)
+    while len(_RESPONSE_CACHE) > RESPONSE_CACHE_SIZE:
+        _RESPONSE_CACHE.popitem(last=False)
+
+
+def _prune_chat_sessions(now: float) -> None:
+    # Sessions are kept in last-used order, so expired and over-capacity entries are all at
+    # the front and pruning stops at the first one that may stay.
+    while _CHAT_SESSIONS:
+        cid, (last_used, _) = next(iter(_CHAT_SESSIONS.items()))
+        if now - last_used <= CHAT_SESSION_TTL_SECONDS and len(_CHAT_SESSIONS) <= CHAT_SESSION_MAX:
+            break
+        _CHAT_SESSIONS.popitem(last=False)
+        lock = _CHAT_SESSION_LOCKS.get(cid)
+        if lock is not None and not lock.locked():
+            _CHAT_SESSION_LOCKS.pop(cid, None)
+
+
+def _get_chat_session(conversation_id: str) -> Optional[Any]:
+    """Return the live chat session for a conversation, or None if it is unknown or expired."""
+    _prune_chat_sessions(time.monotonic())
+    entry = _CHAT_SESSIONS.get(conversation_id)
+    return entry[1] if entry else None
+
+
+def _store_chat_session(conversation_id: str, chat_session: Any) -> None:
+    now = time.monotonic()
+    _CHAT_SESSIONS[conversation_id] = (now, chat_session)
+    _CHAT_SESSIONS.move_to_end(conversation_id)
+    _prune_chat_sessions(now)
+
+
+def _drop_chat_session(conversation_id: str) -> None:
+    # The caller still holds the conversation's lock, and other requests may be queued on it;
+    # replacing it would let a newcomer run a turn alongside them, so only the session goes.
+    _CHAT_SESSIONS.pop(conversation_id, None)
+
+
+def _is_user_text_turn(content: Any) -> bool:
+    return content.role == "user" and not any(getattr(part, "function_response", None) for part in content.parts)
+
+
+def _cap_session_history(history: List[Any], limit: int) -> List[Any]:
+    """Keep at most `limit` trailing turns, starting at a user text turn.
+
+    Cutting anywhere else could leave a function response without the call it answers,
+    which the model rejects; call/response exchanges are therefore dropped as a unit.
+    """
+    for start in range(max(len(history) - limit, 0), len(history)):
+        if _is_user_text_turn(history[start]):
+            return history[start:]
+    return []
+
+
+def _settle_chat_session(chat_session: Any, response: Optional[Dict[str, Any]] = None) -> bool:
+    """Keep a persisted session sendable and bounded after a turn.
+
+    A turn whose stream broke or was stopped for safety is rewound, since the SDK cannot
+    build history from it. Answers returned straight from a tool result (dashboards,
+    refinements) never send the function response back, so a compact one is recorded
+    together with the answer shown to the user; follow-ups keep the data turn as context
+    and the model never sees a dangling call. The history is then capped at the usual
+    turn limit. Returns False if the session could not be repaired and must be dropped.
+    """
+    try:
+        try:
+            history = chat_session.history
+        except Exception as e:
+            logger.warning("Rewinding broken chat turn: %s", e)
+            chat_session.rewind()
+            history = chat_session.history
+
+        pending_calls = [
+            part.function_call.name for part in history[-1].parts if getattr(part, "function_call", None)
+        ] if history else []
+        if pending_calls:
+            answer = (response or {}).get("summary_text") or (response or {}).get("response") or "Displayed the requested data."
+            chat_session.history = [
+                *history,
+                {
+                    "role": "user",
+                    "parts": [
+                        {"function_response": {"name": name, "response": {"content": {"summary": answer}}}}
+                        for name in pending_calls
+                    ],
+                },
+                {"role": "model", "parts": [answer]},
+            ]
+            history = chat_session.history
+
+        limit = DEFAULT_HISTORY_LIMIT - DEFAULT_HISTORY_LIMIT % 2
+        if limit > 0 and len(history) > limit:
+            chat_session.history = _cap_session_history(history, limit)
+        return True
+    except Exception:
+        logger.exception("Chat session could not be settled, dropping it")
+        return False
+
+
+async def _answer_direct_query(user_query: str, args: Dict[str, Any]) -> Optional[dict]:
+    """Answer a stereotyped map query (see match_direct_query) with a direct tool call,
+    skipping both Gemini calls.
+
+    Returns None whenever the tool result cannot be turned into a dashboard, so the caller
+    falls back to the LLM path.
+    """
+    try:
+        rows = await get_demographic_data(**args)
+    except Exception:
+        logger.exception("Direct tool call failed for %r, falling back to the model", user_query)
+        return None
+    if not isinstance(rows, list) or not rows:
+        return None
+
+    logger.info("Answered %r with a direct tool call: %s", user_query, args)
+    return await _run_dashboard_builder(build_dashboard_response, len(rows), rows, args, 0, 0)
+
+
+async def _record_direct_turn(
+    conversation_id: str,
+    user_query: str,
+    args: Dict[str, Any],
+    response: Dict[str, Any],
+) -> None:
+    """Add a directly answered turn to the conversation's live chat session, if it has one.
+
+    The turn is recorded as the tool call the model would have made; settling then adds the
+    compact function response and summary, as for dashboards answered on the model path.
+    Without a live session the next turn starts from the client's chat_history instead.
+    """
+    lock = _CHAT_SESSION_LOCKS.setdefault(conversation_id, asyncio.Lock())
+    async with lock:
+        chat_session = _get_chat_session(conversation_id)
+        if chat_session is None:
+            return
+        chat_session.history = [
+            *chat_session.history,
+            {"role": "user", "parts": [user_query]},
+            {"role": "model", "parts": [{"function_call": {"name": "get_demographic_data", "args": args}}]},
+        ]
+        if _settle_chat_session(chat_session, response):
+            _store_chat_session(conversation_id, chat_session)
+        else:
+            _drop_chat_session(conversation_id)
+
+
 async def get_ai_response(
     user_query: str,
     chat_history: Optional[List[Dict[str, Any]]] = None,
     conversation_context: Optional[Dict[str, Any]] = None,
+    conversation_id: Optional[str] = None,
+) -> dict:
+    """Answer a user query, reusing recent structured answers for identical requests.
+
+    Only structured payloads (dashboards) are cached, and only for short histories, so
+    conversational text answers and long sessions always reach the model. When a
+    conversation_id is given, its chat session is kept between requests instead of being
+    rebuilt from chat_history each time.
+    """
+    trimmed_history = truncate_history(chat_history)
+
+    cache_key = None
+    has_live_session = bool(conversation_id) and _get_chat_session(conversation_id) is not None
+    if (
+        not has_live_session
+        and RESPONSE_CACHE_SIZE > 0
+        and len(trimmed_history) <= RESPONSE_CACHE_MAX_HISTORY
+    ):
+        cache_key = _response_cache_key(user_query, trimmed_history, conversation_context)
+        cached_response = _get_cached_response(cache_key)
+        if cached_response is not None:
+            logger.info("Returning cached response for repeated query")
+            return cached_response
+
+    direct_args = match_direct_query(user_query) if DIRECT_QUERY_ROUTING else None
+    direct_response = await _answer_direct_query(user_query, direct_args) if direct_args else None
+    if direct_response is not None:
+        response = direct_response
+        if conversation_id:
+            await _record_direct_turn(conversation_id, user_query, direct_args, direct_response)
+    elif conversation_id:
+        lock = _CHAT_SESSION_LOCKS.setdefault(conversation_id, asyncio.Lock())
+        async with lock:
+            chat_session = _get_chat_session(conversation_id)
+            if chat_session is None:
+                chat_session = _get_model().start_chat(history=trimmed_history)
+            else:
+                logger.debug("Reusing chat session for conversation %s", conversation_id)
+                if not chat_session.history and trimmed_history:
+                    chat_session.history = trimmed_history
+            response = None
+            try:
+                response = await _generate_ai_response(
+                    user_query, chat_session, conversation_context, tried_tool_args=direct_args
+                )
+            finally:
+                if _settle_chat_session(chat_session, response):
+                    _store_chat_session(conversation_id, chat_session)
+                else:
+                    _drop_chat_session(conversation_id)
+    else:
+        chat_session = _get_model().start_chat(history=trimmed_history)
+        response = await _generate_ai_response(user_query, chat_session, conversation_context, tried_tool_args=direct_args)
+
+    if cache_key and isinstance(response, dict) and response.get("type"):
+        _store_cached_response(cache_key, response)
+    return response
+
+
+async def _execute_tool(registered_tool: Tuple[Any, bool], args: Dict[str, Any]) -> Any:
+    """Run a registered tool, sending synchronous ones to the dedicated tool pool."""
+    actual_function, is_coroutine = registered_tool
+    if is_coroutine:
+        return await actual_function(**args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_tool_executor(), partial(actual_function, **args))
+
+
+DispatchedToolCall = Tuple[str, Dict[str, Any], Optional["asyncio.Task[Any]"]]
+
+
+def _discard_task(task: "asyncio.Task[Any]") -> None:
+    """Cancel an unneeded task, or consume its outcome if it already finished."""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+
+async def _stream_and_dispatch_tools(
+    chat_session: Any,
+    content: Any,
+    speculative_call: Optional[Tuple[Dict[str, Any], "asyncio.Task[Any]"]] = None,
+    **send_kwargs: Any,
+) -> Tuple[Any, List[DispatchedToolCall]]:
+    """Stream a model turn, starting each requested tool as soon as its call arrives.
+
+    Tool execution (usually a Census API request) overlaps with the rest of the model's
+    decoding. A speculative (guessed args, task) pair already in flight is reused when the
+    model asks for exactly that request, and cancelled otherwise. Returns the fully drained
+    response and, in call order, each call's name, normalized args and running task (None
+    for unknown tools).
+    """
+    dispatched: List[DispatchedToolCall] = []
+    drained = False
+    try:
+        streamed_response = await _send_message_with_retry(chat_session, content, stream=True, **send_kwargs)
+        async for chunk in streamed_response:
+            chunk_candidates = chunk.candidates
+            if not chunk_candidates:
+                continue
+            for part in chunk_candidates[0].content.parts:
+                function_call = getattr(part, "function_call", None)
+                if not function_call:
+                    continue
+                args = _function_call_args(function_call)
+                if (
+                    speculative_call is not None
+                    and function_call.name == "get_demographic_data"
+                    and _is_guessed_request(args, speculative_call[0])
+                ):
+                    logger.debug("Model call matches the speculative tool call, reusing it")
+                    tool_task = speculative_call[1]
+                    speculative_call = None
+                else:
+                    registered_tool = AVAILABLE_FUNCTIONS.get(function_call.name)
+                    tool_task = asyncio.create_task(_execute_tool(registered_tool, args)) if registered_tool else None
+                dispatched.append((function_call.name, args, tool_task))
+        drained = True
+    finally:
+        if speculative_call is not None:
+            _discard_task(speculative_call[1])
+        if not drained:
+            # The stream failed or the caller was cancelled: nobody will await the tools
+            # already started, so stop them rather than leave them calling the Census API.
+            started = [tool_task for _, _, tool_task in dispatched if tool_task is not None]
+            for tool_task in started:
+                _discard_task(tool_task)
+            await asyncio.gather(*started, return_exceptions=True)
+    return streamed_response, dispatched
+
+
+async def _answer_parallel_tool_calls(
+    chat_session: Any,
+    dispatched: List[DispatchedToolCall],
+    total_prompt_tokens: int,
+    total_completion_tokens: int,
+) -> dict:
+    """Wait for several concurrently running tool calls and interpret them together.
+
+    Results are summarized and sent back in call order as a single batch of function
+    responses, so latency is bounded by the slowest tool rather than the sum of all.
+    """
+    calls = [(function_name, args) for function_name, args, _ in dispatched]
+    logger.info("Gemini requested %d tool calls, executing concurrently: %s", len(calls), [name for name, _ in calls])
+
+    async def await_call(function_name: str, tool_task: Optional["asyncio.Task[Any]"]) -> Any:
+        if tool_task is None:
+            raise ValueError(f"Model tried to call unknown function '{function_name}'.")
+        return await tool_task
+
+    results = await asyncio.gather(
+        *(await_call(function_name, tool_task) for function_name, _, tool_task in dispatched),
+        return_exceptions=True,
+    )
+
+    function_responses: List[Dict[str, Any]] = []
+    for (function_name, args), result in zip(calls, results):
+        if isinstance(result, Exception):
+            logger.error("Error executing function %s: %s", function_name, result)
+            content: Dict[str, Any] = {"error": f"Error executing function {function_name}: {str(result)}"}
+        else:
+            rows = result.get("data") if isinstance(result, dict) else result
+            content = summarize_tool_result(rows, args)
+        function_responses.append(
+            {"function_response": {"name": function_name, "response": {"content": content}}}
+        )
+
+    logger.debug("Sending to Gemini (2nd call): %d tool responses", len(function_responses))
+    final_text, has_candidates, usage_metadata = await _stream_chat_text(chat_session, function_responses)
+    if usage_metadata:
+        total_prompt_tokens += usage_metadata.prompt_token_count
+        total_completion_tokens += usage_metadata.candidates_token_count
+
+    if not has_candidates:
+        return _text_response("AI did not return a valid response structure after tool execution.", total_prompt_tokens, total_completion_tokens)
+    if final_text:
+        return _text_response(final_text, total_prompt_tokens, total_completion_tokens)
+    return _text_response("AI processed tool output, but no text response was generated.", total_prompt_tokens, total_completion_tokens)
+
+
+async def _get_ai_response_bounded(user_query: str) -> dict:
+    async with _BATCH_SEMAPHORE:
+        return await get_ai_response(user_query)
+
+
+async def get_ai_responses_batch(queries: List[str]) -> List[Any]:
+    """Answer many independent queries concurrently, e.g. for evaluation or back-fill jobs.
+
+    At most GEMINI_CONCURRENCY queries are in flight at once; per-query failures are
+    returned in place rather than cancelling the rest of the batch.
+    """
+    return await asyncio.gather(
+        *(_get_ai_response_bounded(query) for query in queries),
+        return_exceptions=True,
+    )
+
+
+async def _generate_ai_response(
+    user_query: str,
+    current_chat_session: Any,
+    conversation_context: Optional[Dict[str, Any]] = None,
+    tried_tool_args: Optional[Dict[str, Any]] = None,
 ) -> dict:
     """
     Generates a response from the Gemini Pro model, potentially using tools.
@@ -433,229 +1316,133 @@ async def get_ai_response(
     total_completion_tokens = 0
     
     try:
-        map_keywords = ['map', 'show me', 'display', 'visualize', 'chart', 'counties', 'states', 'income', 'population', 'demographic']
-        lower_query = user_query.lower()
-        is_map_request = any(keyword in lower_query for keyword in map_keywords)
-        is_time_series_request = detect_time_series_request(user_query)
+        is_map_request, is_time_series_request = detect_intents(user_query)
 
-        trimmed_history = truncate_history(chat_history)
         if conversation_context:
-            context_keys = ", ".join(sorted(conversation_context.keys()))
-            print(f"Conversation context provided with keys: {context_keys}")
+            logger.debug("Conversation context provided with keys: %s", ", ".join(sorted(conversation_context.keys())))
 
-        current_chat_session = model.start_chat(history=trimmed_history)
+        query_for_llm = build_query_prompt(user_query, conversation_context=conversation_context)
+        send_kwargs: Dict[str, Any] = {}
+        if FORCE_TOOL_CALLS and FORCE_TOOL_VERBS_RE.search(user_query):
+            send_kwargs["tool_config"] = FORCED_TOOL_CONFIG
 
-        query_for_llm = build_query_prompt(
+        logger.info(
+            "Sending to Gemini (1st call): Query: %r (Map request: %s, Time-series: %s)",
             user_query,
             is_map_request,
             is_time_series_request,
-            conversation_context=conversation_context,
         )
-
-        print(
-            f"\nSending to Gemini (1st call): Query: '{user_query}' "
-            f"(Map request: {is_map_request}, Time-series: {is_time_series_request})"
+        speculative_call = None
+        if SPECULATIVE_TOOL_CALLS and not is_time_series_request:
+            guessed_args = guess_tool_args(user_query)
+            # A request the direct route already sent came back empty; sending it again won't help.
+            if guessed_args is not None and guessed_args != tried_tool_args:
+                logger.debug("Starting speculative tool call: %s", guessed_args)
+                speculative_call = (guessed_args, asyncio.create_task(get_demographic_data(**guessed_args)))
+
+        response, dispatched_calls = await _stream_and_dispatch_tools(
+            current_chat_session,
+            query_for_llm,
+            speculative_call,
+            **send_kwargs,
         )
-        response = await current_chat_session.send_message_async(query_for_llm)
         
         # Track token usage from first LLM call
-        if response.usage_metadata:
-            total_prompt_tokens += response.usage_metadata.prompt_token_count
-            total_completion_tokens += response.usage_metadata.candidates_token_count
-            print(f"Token usage (1st call): Prompt={response.usage_metadata.prompt_token_count}, Completion={response.usage_metadata.candidates_token_count}")
+        usage_metadata = response.usage_metadata
+        if usage_metadata:
+            total_prompt_tokens += usage_metadata.prompt_token_count
+            total_completion_tokens += usage_metadata.candidates_token_count
+            logger.info("Token usage (1st call): Prompt=%s, Completion=%s", usage_metadata.prompt_token_count, usage_metadata.candidates_token_count)
         
-        # It's good practice to check if candidates exist and have content
-        if not response.candidates or not response.candidates[0].content.parts:
-            return {
-                "response": "AI did not return a valid response structure.",
-                "token_usage": {
-                    "prompt_tokens": total_prompt_tokens,
-                    "completion_tokens": total_completion_tokens,
-                    "total_tokens": total_prompt_tokens + total_completion_tokens
-                }
-            }
-        response_part = response.candidates[0].content.parts[0]
-
-        if hasattr(response_part, 'function_call') and response_part.function_call:
-            function_call = response_part.function_call
-            function_name = function_call.name
-            args = _normalize_tool_args(dict(function_call.args))
-
-            print(f"Gemini wants to call function: {function_name} with args: {args}")
-
-            if function_name in AVAILABLE_FUNCTIONS:
-                actual_function = AVAILABLE_FUNCTIONS[function_name]
+        # Bind the proto accessors once; each attribute hop goes through descriptor lookups.
+        candidates = response.candidates
+        response_parts = candidates[0].content.parts if candidates else None
+        if not response_parts:
+            return _text_response("AI did not return a valid response structure.", total_prompt_tokens, total_completion_tokens)
+        if len(dispatched_calls) > 1:
+            return await _answer_parallel_tool_calls(
+                current_chat_session,
+                dispatched_calls,
+                total_prompt_tokens,
+                total_completion_tokens,
+            )
+        response_part = response_parts[0]
+
+        if dispatched_calls:
+            # The tool was already started while the rest of the turn streamed in.
+            function_name, args, tool_task = dispatched_calls[0]
+
+            logger.info("Gemini wants to call function: %s with args: %s", function_name, args)
+
+            if tool_task is not None:
                 function_response_content_for_llm = None # Renamed for clarity
                 try:
-                    debug_arg_types = {key: str(type(value)) for key, value in args.items()}
-                    print(f"Function call argument types: {debug_arg_types}")
-                    print(f"Executing tool: {function_name}")
-                    if asyncio.iscoroutinefunction(actual_function):
-                        tool_execution_result = await actual_function(**args)
-                    else:
-                        loop = asyncio.get_running_loop()
-                        tool_execution_result = await loop.run_in_executor(None, actual_function, **args)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        debug_arg_types = {key: str(type(value)) for key, value in args.items()}
+                        logger.debug("Function call argument types: %s", debug_arg_types)
+                    logger.debug("Awaiting tool: %s", function_name)
+                    tool_execution_result = await tool_task
                     
-                    record_count = len(tool_execution_result) if isinstance(tool_execution_result, list) else 'n/a'
-                    print(f"Tool '{function_name}' executed. Result type: {type(tool_execution_result)}, records: {record_count}")
+                    logger.info(
+                        "Tool '%s' executed. Result type: %s, records: %s",
+                        function_name,
+                        type(tool_execution_result).__name__,
+                        len(tool_execution_result) if isinstance(tool_execution_result, list) else "n/a",
+                    )
                     if function_name == "refine_dashboard_data" and isinstance(tool_execution_result, dict):
-                        print("Refinement tool executed, returning refined payload without additional LLM round-trip.")
+                        logger.debug("Refinement tool executed, returning refined payload without additional LLM round-trip.")
                         refined_payload = dict(tool_execution_result)
                         refined_payload.setdefault(
                             "token_usage",
-                            {
-                                "prompt_tokens": total_prompt_tokens,
-                                "completion_tokens": total_completion_tokens,
-                                "total_tokens": total_prompt_tokens + total_completion_tokens,
-                            },
+                            _build_token_usage(total_prompt_tokens, total_completion_tokens),
                         )
                         return refined_payload
                     if function_name == "get_demographic_time_series":
-                        print("Time-series response detected, constructing dashboard output.")
-                        return build_time_series_dashboard(
+                        logger.debug("Time-series response detected, constructing dashboard output.")
+                        time_series_rows = tool_execution_result.get("data") if isinstance(tool_execution_result, dict) else None
+                        return await _run_dashboard_builder(
+                            build_time_series_dashboard,
+                            len(time_series_rows) if isinstance(time_series_rows, list) else 0,
                             tool_execution_result,
                             args,
                             total_prompt_tokens,
                             total_completion_tokens,
                         )
                     
-                    # Phase 7: Check if this is a map/dashboard request and we have valid data
-                    if is_map_request and function_name == "get_demographic_data" and isinstance(tool_execution_result, list) and tool_execution_result:
-                        print("Dashboard request detected with valid data, creating structured response")
-                        # tool_execution_result is already a list of data items
-                        data_items = tool_execution_result
-
-                        variable_labels = get_variable_labels()
-                        
-                        # Find the display variable - prioritize derived metrics, then regular variables
-                        sample_item = data_items[0]
-                        display_variable_id = None
-                        
-                        # First, check if we have any derived metrics (they take priority for display)
-                        requested_derived_metrics = args.get("derived_metrics", [])
-                        if requested_derived_metrics:
-                            # Use the first derived metric as the display variable
-                            for metric in requested_derived_metrics:
-                                if metric in sample_item:
-                                    display_variable_id = metric
-                                    if isinstance(tool_execution_result, list):
-                                        record_count = len(tool_execution_result)
-                                    elif isinstance(tool_execution_result, dict):
-                                        record_count = len(tool_execution_result.get("data", []))
-                                    else:
-                                        record_count = 'n/a'
-                        
-                        # If no derived metrics, find the first regular variable
-                                    if function_name == "get_demographic_time_series" and isinstance(tool_execution_result, dict):
-                                        print("Time-series request detected, creating structured time-series dashboard response")
-                                        return build_time_series_dashboard(
-                                            tool_execution_result,
-                                            args,
-                                            total_prompt_tokens,
-                                            total_completion_tokens,
-                                        )
-
-                        if not display_variable_id:
-                            requested_variables = args.get("variables", [])
-                            for var in requested_variables:
-                                if var in sample_item:
-                                    display_variable_id = var
-                                    break
-                        
-                        # Fallback: find any non-geographic variable
-                        if not display_variable_id:
-                            for key in sample_item.keys():
-                                if key not in ['state', 'county', 'tract', 'place', 'zip code tabulation area']:
-                                    display_variable_id = key
-                                    break
-                        
-                        print(f"Found display_variable_id: {display_variable_id}")
-                        
-                        if display_variable_id:
-                            # === Phase 7: Create Dashboard Data Response ===
-                            
-                            # 1. Get all variables present in the data
-                            all_variables = []
-                            for key in sample_item.keys():
-                                if key not in ['state', 'county', 'tract', 'place', 'zip code tabulation area', 'NAME']:
-                                    if key in variable_labels:
-                                        all_variables.append({"id": key, "name": variable_labels[key]})
-                            
-                            # 2. Calculate summary statistics for all numeric variables
-                            summary_statistics = {}
-                            for var_info in all_variables:
-                                var_id = var_info["id"]
-                                stats = calculate_summary_statistics(data_items, var_id)
-                                if stats:
-                                    summary_statistics[var_id] = stats
-                            
-                            # 3. Prepare chart data (Top 5 entities by display variable)
-                            chart_data = []
-                            if display_variable_id in [item["id"] for item in all_variables]:
-                                # Sort by display variable and get top 5
-                                sorted_data = sorted(data_items, 
-                                                   key=lambda x: float(x.get(display_variable_id, 0) or 0), 
-                                                   reverse=True)[:5]
-                                chart_data = [
-                                    {"name": item.get("NAME", "Unknown"), "value": float(item.get(display_variable_id, 0) or 0)}
-                                    for item in sorted_data
-                                ]
-                            
-                            charts = [{
-                                "chart_type": "bar_chart",
-                                "title": f"Top 5 {args.get('geography_level', 'entities').title()} by {variable_labels.get(display_variable_id, display_variable_id)}",
-                                "variable_id": display_variable_id,
-                                "data": chart_data
-                            }] if chart_data else []
-                            
-                            # 4. Generate heuristic insights without extra LLM calls
-                            variable_label = variable_labels.get(display_variable_id, display_variable_id)
-                            insights = generate_basic_insights(data_items, display_variable_id, variable_label)
-                            summary_text = f"Analysis of {variable_label} across {len(data_items)} {args.get('geography_level', 'entities')}"
-                            
-                            # 5. Ensure data is JSON serializable
-                            import json
-                            try:
-                                serializable_data = json.loads(json.dumps(data_items))
-                            except:
-                                serializable_data = data_items  # fallback
-                            
-                            state_name_arg = args.get("state_name")
-                            state_fips_value = None
-                            if sample_item.get("state") is not None:
-                                try:
-                                    state_fips_value = str(sample_item.get("state")).zfill(2)
-                                except Exception:
-                                    state_fips_value = None
-
-                            # 6. Construct dashboard response
-                            response = {
-                                "type": "dashboard_data",
-                                "summary_text": summary_text,
-                                "data": serializable_data,
-                                "metadata": {
-                                    "geography_level": str(args.get("geography_level", "")),
-                                    "display_variable_id": str(display_variable_id),
-                                    "variable_labels": variable_labels,
-                                    "available_variables": all_variables,
-                                    "state_name": state_name_arg,
-                                    "state_fips": state_fips_value,
-                                },
-                                "charts": charts,
-                                "summary_statistics": summary_statistics,
-                                "insights": insights,
-                                "token_usage": {
-                                    "prompt_tokens": total_prompt_tokens,
-                                    "completion_tokens": total_completion_tokens,
-                                    "total_tokens": total_prompt_tokens + total_completion_tokens
-                                }
-                            }
-                            print(f"Returning dashboard response")
-                            return response
+                    # Map requests are answered with a dashboard built locally; other results
+                    # (e.g. "compare NY and NJ") still get an interpreted text answer.
+                    if (
+                        is_map_request
+                        and function_name == "get_demographic_data"
+                        and isinstance(tool_execution_result, list)
+                        and tool_execution_result
+                    ):
+                        logger.debug("Dashboard request detected with valid data, creating structured response")
+                        dashboard_response = await _run_dashboard_builder(
+                            build_dashboard_response,
+                            len(tool_execution_result),
+                            tool_execution_result,
+                            args,
+                            total_prompt_tokens,
+                            total_completion_tokens,
+                        )
+                        if dashboard_response is not None:
+                            logger.debug("Returning dashboard response")
+                            return dashboard_response
 
                     # Construct the function response as a dictionary for the LLM
                     # This structure is what the Gemini API expects for function responses.
                     summarized_content = summarize_tool_result(tool_execution_result, args)
+                    if (
+                        SKIP_INTERPRETATION
+                        and isinstance(tool_execution_result, list)
+                        and 0 < len(tool_execution_result) <= SKIP_INTERPRETATION_MAX_ROWS
+                    ):
+                        heuristic_answer = build_heuristic_answer(summarized_content, _VARIABLE_LABELS)
+                        if heuristic_answer:
+                            logger.debug("Small tool result answered heuristically, skipping interpretation call.")
+                            return _text_response(heuristic_answer, total_prompt_tokens, total_completion_tokens)
+
                     function_response_content_for_llm = [
                         {
                             "function_response": {
@@ -668,9 +1455,7 @@ async def get_ai_response(
                     ]
 
                 except Exception as e:
-                    import traceback
-                    print(f"Error executing function {function_name}: {e}")
-                    traceback.print_exc()
+                    logger.exception("Error executing function %s: %s", function_name, e)
                     function_response_content_for_llm = [
                         {
                             "function_response": {
@@ -682,84 +1467,36 @@ async def get_ai_response(
                         }
                     ]
                 
-                print(f"\nSending to Gemini (2nd call): Tool response for {function_name}")
-                # Send the list containing the function response dictionary
-                response_after_tool = await current_chat_session.send_message_async(function_response_content_for_llm)
-                
-                # Track token usage from second LLM call
-                if response_after_tool.usage_metadata:
-                    total_prompt_tokens += response_after_tool.usage_metadata.prompt_token_count
-                    total_completion_tokens += response_after_tool.usage_metadata.candidates_token_count
-                    print(f"Token usage (2nd call): Prompt={response_after_tool.usage_metadata.prompt_token_count}, Completion={response_after_tool.usage_metadata.candidates_token_count}")
-                
-                if not response_after_tool.candidates or not response_after_tool.candidates[0].content.parts:
-                    return {
-                        "response": "AI did not return a valid response structure after tool execution.",
-                        "token_usage": {
-                            "prompt_tokens": total_prompt_tokens,
-                            "completion_tokens": total_completion_tokens,
-                            "total_tokens": total_prompt_tokens + total_completion_tokens
-                        }
-                    }
-                final_response_part = response_after_tool.candidates[0].content.parts[0]
-
-                if hasattr(final_response_part, 'text'):
-                    return {
-                        "response": final_response_part.text,
-                        "token_usage": {
-                            "prompt_tokens": total_prompt_tokens,
-                            "completion_tokens": total_completion_tokens,
-                            "total_tokens": total_prompt_tokens + total_completion_tokens
-                        }
-                    }
+                logger.debug("Sending to Gemini (2nd call): Tool response for %s", function_name)
+                # Send the list containing the function response dictionary, accumulating the
+                # interpretation as it streams back instead of waiting for the full decode.
+                final_text, has_candidates, usage_metadata = await _stream_chat_text(
+                    current_chat_session,
+                    function_response_content_for_llm,
+                )
+
+                # Track token usage from second LLM call (reported on the final streamed chunk)
+                if usage_metadata:
+                    total_prompt_tokens += usage_metadata.prompt_token_count
+                    total_completion_tokens += usage_metadata.candidates_token_count
+                    logger.info("Token usage (2nd call): Prompt=%s, Completion=%s", usage_metadata.prompt_token_count, usage_metadata.candidates_token_count)
+
+                if not has_candidates:
+                    return _text_response("AI did not return a valid response structure after tool execution.", total_prompt_tokens, total_completion_tokens)
+
+                if final_text:
+                    return _text_response(final_text, total_prompt_tokens, total_completion_tokens)
                 else:
-                    return {
-                        "response": "AI processed tool output, but no text response was generated.",
-                        "token_usage": {
-                            "prompt_tokens": total_prompt_tokens,
-                            "completion_tokens": total_completion_tokens,
-                            "total_tokens": total_prompt_tokens + total_completion_tokens
-                        }
-                    }
+                    return _text_response("AI processed tool output, but no text response was generated.", total_prompt_tokens, total_completion_tokens)
             else:
-                return {
-                    "response": f"Error: Model tried to call unknown function '{function_name}'.",
-                    "token_usage": {
-                        "prompt_tokens": total_prompt_tokens,
-                        "completion_tokens": total_completion_tokens,
-                        "total_tokens": total_prompt_tokens + total_completion_tokens
-                    }
-                }
+                return _text_response(f"Error: Model tried to call unknown function '{function_name}'.", total_prompt_tokens, total_completion_tokens)
         
         elif hasattr(response_part, 'text'):
-            return {
-                "response": response_part.text,
-                "token_usage": {
-                    "prompt_tokens": total_prompt_tokens,
-                    "completion_tokens": total_completion_tokens,
-                    "total_tokens": total_prompt_tokens + total_completion_tokens
-                }
-            }
+            return _text_response(response_part.text, total_prompt_tokens, total_completion_tokens)
         
-        return {
-            "response": "Sorry, I couldn't generate a valid response (no function call or text).",
-            "token_usage": {
-                "prompt_tokens": total_prompt_tokens,
-                "completion_tokens": total_completion_tokens,
-                "total_tokens": total_prompt_tokens + total_completion_tokens
-            }
-        }
+        return _text_response("Sorry, I couldn't generate a valid response (no function call or text).", total_prompt_tokens, total_completion_tokens)
 
     except Exception as e:
-        print(f"Error in get_ai_response: {e}")
-        import traceback
-        traceback.print_exc()
-        return {
-            "response": "Sorry, there was a critical error in the AI orchestration.",
-            "token_usage": {
-                "prompt_tokens": total_prompt_tokens,
-                "completion_tokens": total_completion_tokens,
-                "total_tokens": total_prompt_tokens + total_completion_tokens
-            }
-        }
+        logger.exception("Error in get_ai_response: %s", e)
+        return _text_response("Sorry, there was a critical error in the AI orchestration.", total_prompt_tokens, total_completion_tokens)
 
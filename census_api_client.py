@@ -1,10 +1,108 @@
 import asyncio
+import logging
 import httpx # Using httpx for async requests, requests for sync if preferred
 import os
+import random
+import orjson
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 import config # TEMP: absolute import for testing
 
+logger = logging.getLogger(__name__)
+
+# Sized for concurrent fan-out: a time-series tool call alone issues one request per year.
+HTTP_MAX_CONNECTIONS = int(os.getenv("CENSUS_HTTP_MAX_CONNECTIONS", "128"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("CENSUS_HTTP_MAX_KEEPALIVE_CONNECTIONS", "64"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("CENSUS_HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("CENSUS_HTTP_TIMEOUT_SECONDS", "15"))
+# Process-wide cap on simultaneous Census API requests, to stay clear of its rate limits.
+CENSUS_CONCURRENCY = int(os.getenv("CENSUS_CONCURRENCY", "16"))
+_REQUEST_SEMAPHORE = asyncio.Semaphore(CENSUS_CONCURRENCY)
+# Transient Census failures (rate limiting, gateway errors) are retried with exponential backoff.
+CENSUS_RETRY_ATTEMPTS = int(os.getenv("CENSUS_RETRY_ATTEMPTS", "5"))
+CENSUS_RETRY_MAX_DELAY_SECONDS = float(os.getenv("CENSUS_RETRY_MAX_DELAY_SECONDS", "30"))
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+_INFLIGHT_REQUESTS: "Dict[Tuple[Any, ...], asyncio.Future[List[Dict[str, Any]]]]" = {}
+# Callers currently awaiting each in-flight fetch; the fetch is cancelled when all have gone.
+_FETCH_WAITERS: "Dict[asyncio.Future[List[Dict[str, Any]]], int]" = {}
+
+# One pooled client for the whole process so repeated Census requests reuse
+# keep-alive connections instead of paying a TCP+TLS handshake each time.
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=HTTP_TIMEOUT_SECONDS,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared client; call on application shutdown."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After if given, else jittered backoff."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return min(CENSUS_RETRY_MAX_DELAY_SECONDS, max(0.0, float(retry_after)))
+        except ValueError:
+            pass  # HTTP-date form; fall back to our own schedule
+    return min(CENSUS_RETRY_MAX_DELAY_SECONDS, 2 ** attempt) + random.uniform(0, 0.5)
+
+
+async def _get_with_retry(url: str, params: List[Tuple[str, str]]) -> httpx.Response:
+    """GET a Census URL, retrying 429/5xx responses; the last response is returned as-is."""
+    attempt = 0
+    while True:
+        async with _REQUEST_SEMAPHORE:
+            response = await get_http_client().get(url, params=params)
+        attempt += 1
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= CENSUS_RETRY_ATTEMPTS:
+            return response
+        delay = _retry_delay(response, attempt - 1)
+        logger.warning("Census API returned %s for %s; retrying in %.1fs", response.status_code, url, delay)
+        # Sleep outside the semaphore so waiting retries do not hold up other requests.
+        await asyncio.sleep(delay)
+
+
+def _acs_request_key(year: int, variables: list[str], for_geo: str, in_geos: Optional[dict]) -> Tuple[Any, ...]:
+    return (year, tuple(variables), for_geo, tuple((in_geos or {}).items()))
+
+
+def _forget_inflight_request(request_key: Tuple[Any, ...], fetch_task: "asyncio.Future[Any]") -> None:
+    if _INFLIGHT_REQUESTS.get(request_key) is fetch_task:
+        del _INFLIGHT_REQUESTS[request_key]
+
+
+def _release_fetch_waiter(fetch_task: "asyncio.Future[Any]") -> int:
+    """Drops one waiter from a fetch, cancelling it if it was the last; returns the waiters left."""
+    waiters = _FETCH_WAITERS.pop(fetch_task) - 1
+    if waiters:
+        _FETCH_WAITERS[fetch_task] = waiters
+    elif not fetch_task.done():
+        fetch_task.cancel()
+    return waiters
+
+
 class CensusAPIClient:
     BASE_URL = "https://api.census.gov/data"
+    # Instances are created per tool call; the HTTP client and in-flight map are module-level.
+    __slots__ = ("api_key",)
 
     def __init__(self):
         self.api_key = os.getenv("CENSUS_API_KEY")
@@ -29,77 +127,91 @@ class CensusAPIClient:
             Returns an empty list if an error occurs or no data is found.
         """
         if not variables:
-            print("Error: No variables specified for Census API call.")
+            logger.error("No variables specified for Census API call.")
             return []
 
-        get_vars = ",".join(variables)
-        params = {
-            "get": get_vars,
-            "for": for_geo, # CORRECTED: Use for_geo directly as tools.py now formats it correctly.
-            "key": self.api_key
-        }
+        # Canonicalize once so equivalent requests share a request key and a duplicated
+        # variable is neither sent twice nor returned as a repeated column.
+        variables = list(dict.fromkeys(variables))
+        for_geo = for_geo.strip().lower()  # Census geography names are lowercase; FIPS codes have no case
+
+        # Results are cached by the tools layer (get_demographic_data and the time-series
+        # cache); here, identical requests already on the wire (e.g. the same map asked for
+        # by several users at once) share one HTTP round trip instead of each sending their own.
+        request_key = _acs_request_key(year, variables, for_geo, in_geos)
+        fetch_task = _INFLIGHT_REQUESTS.get(request_key)
+        created = fetch_task is None
+        if created:
+            fetch_task = asyncio.ensure_future(self._request_records(year, variables, for_geo, in_geos))
+            _INFLIGHT_REQUESTS[request_key] = fetch_task
+            fetch_task.add_done_callback(partial(_forget_inflight_request, request_key))
+        else:
+            logger.debug("Joining in-flight Census request for %s", request_key)
+        # Shielded so one cancelled caller does not cancel the fetch for the others; once
+        # every caller has been cancelled nobody wants the response, so the fetch stops too.
+        _FETCH_WAITERS[fetch_task] = _FETCH_WAITERS.get(fetch_task, 0) + 1
+        try:
+            records = await asyncio.shield(fetch_task)
+        finally:
+            waiters_left = _release_fetch_waiter(fetch_task)
+        # Callers enrich the rows in place. The creator resumes first, so it keeps the fetched
+        # list unless joined callers are still waiting to copy it; joined callers get copies.
+        if created and not waiters_left:
+            return records
+        return [dict(record) for record in records]
+
+    async def get_acs5_data_many(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Runs several get_acs5_data calls concurrently.
 
-        # Construct the &in= part of the query if in_geos is provided
-        in_clause_parts = []
+        Args:
+            requests: Keyword arguments for get_acs5_data, one dict per call.
+
+        Returns:
+            One result per request, in request order; a call that raised yields its exception.
+            Concurrency is bounded process-wide by CENSUS_CONCURRENCY.
+        """
+        return await asyncio.gather(
+            *(self.get_acs5_data(**request) for request in requests),
+            return_exceptions=True,
+        )
+
+    async def _request_records(
+        self,
+        year: int,
+        variables: list[str],
+        for_geo: str,
+        in_geos: Optional[dict],
+    ) -> List[Dict[str, Any]]:
+        # httpx encodes the query; each parent geography is its own repeated "in" parameter,
+        # e.g. for=tract:*&in=state:06&in=county:037.
+        params = [("get", ",".join(variables)), ("for", for_geo)]
         if in_geos:
-            # Order matters for Census API: state, then county, etc.
-            # We can refine this order based on GEOGRAPHY_HIERARCHY if needed, but for now, a simple sort might work
-            # or we rely on the caller (tools.py) to provide them in a sensible order if multiple.
-            # For ACS, typical hierarchy is state -> county -> tract, or state -> place, etc.
-            for parent_geo_api_name, parent_geo_id in in_geos.items():
-                in_clause_parts.append(f"{parent_geo_api_name}:{parent_geo_id}")
-        
-        if in_clause_parts:
-            params["in"] = " ".join(in_clause_parts) # Note: Census API uses space for multiple &in, but we only support one chain for now
-            # Example: &in=state:06 county:037. If we need multiple &in for different hierarchies, this needs adjustment.
-            # The plan implies a single chain: &in=state:value&in=county:value (which is not how Census API works)
-            # Correct Census API for chained &in is more like: for=tract:*&in=state:06&in=county:037
-            # So, the `params["in"]` should be a list of strings if httpx supports it, or handle multiple `&in=` by constructing the URL string manually.
-            # For now, let's assume `in_geos` provides the full hierarchy for a single `for` target.
-            # The `for` clause should be the most granular level, and `in` clauses specify its parents.
-            # Example: for_geo="tract", in_geos={"state":"06", "county":"037"}
-            # URL part: ...&for=tract:*&in=state:06&in=county:037
-            # The current `params["in"]` construction is simplified and might need refinement based on how `tools.py` structures `in_geos`.
-            # Let's refine this to build the &in clauses correctly.
-            del params["in"] # Remove the simplified one
-            in_params_string = ""
-            if in_geos:
-                for parent_geo_api_name, parent_geo_id in in_geos.items():
-                    in_params_string += f"&in={parent_geo_api_name}:{parent_geo_id}"
-
-        # Construct the full URL
-        # Example dataset: American Community Survey 5-Year Data (ACS5)
-        # We might need to make the dataset (e.g., "acs/acs5") configurable too.
-        # For now, hardcoding to acs/acs5 for 5-year estimates.
-        url = f"{self.BASE_URL}/{year}/acs/acs5?get={get_vars}&for={for_geo}" # CORRECTED: Use for_geo directly
-        if in_geos: # Re-evaluating how to add &in clauses with httpx
-             url += in_params_string
-        url += f"&key={self.api_key}"
-
-        print(f"Requesting Census Data from URL: {url}") # For debugging
+            params.extend(("in", f"{api_name}:{geo_id}") for api_name, geo_id in in_geos.items())
+        logger.debug("Requesting Census data for %s/acs/acs5 with %s", year, params)
+        params.append(("key", self.api_key))
 
+        url = f"{self.BASE_URL}/{year}/acs/acs5"
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-                response.raise_for_status()  # Raises an exception for 4XX/5XX responses
-                data = response.json()
-                
-                if not data or len(data) < 2: # Expecting header row + data rows
-                    print(f"No data returned or unexpected format from Census API for query: {url}")
-                    return []
-
-                # Convert list of lists to list of dicts using the header row
-                header = data[0]
-                records = [dict(zip(header, row)) for row in data[1:]]
-                return records
+            response = await _get_with_retry(url, params)
+            response.raise_for_status()  # Raises an exception for 4XX/5XX responses
+            data = orjson.loads(response.content)
+
+            if not data or len(data) < 2: # Expecting header row + data rows
+                logger.warning("No data returned or unexpected format from Census API for %s %s", url, params[:-1])
+                return []
+
+            # Convert list of lists to list of dicts using the header row
+            header = data[0]
+            return [dict(zip(header, row)) for row in data[1:]]
         except httpx.HTTPStatusError as e:
-            print(f"HTTP error occurred: {e} - {e.response.text}")
+            logger.error("HTTP error occurred: %s - %s", e, e.response.text)
             return []
         except httpx.RequestError as e:
-            print(f"Request error occurred: {e}")
+            logger.error("Request error occurred: %s", e)
             return []
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
+            logger.exception("An unexpected error occurred: %s", e)
             return []
 
 
@@ -70,39 +70,70 @@ GEOGRAPHY_ALIASES = {
     "census tract": "tract",
 }
 
+# Derived-metric calculations. Each reads its inputs from the row once; a missing
+# column falls back to 0 (1 for denominators), and an unparseable value raises so
+# enrich_data can record the metric as None.
+def _male_female_difference(row, labels):
+    return float(row.get(labels["male_population"], 0)) - float(row.get(labels["female_population"], 0))
+
+
+def _unemployment_percentage(row, labels):
+    unemployed = float(row.get(labels["unemployment_rate"], 0))
+    labor_force = unemployed + float(row.get(labels["employment_rate"], 0))
+    return (unemployed / labor_force) * 100 if labor_force > 0 else 0
+
+
+def _share_percentage(part_key, total_key):
+    def calculation(row, labels):
+        total = float(row.get(labels[total_key], 1))
+        return (float(row.get(labels[part_key], 0)) / total) * 100 if total > 0 else 0
+    return calculation
+
+
+def _housing_vacancy_rate(row, labels):
+    total_key = labels["total_housing_units"]
+    total = float(row.get(total_key, 1))
+    if not total > 0:
+        return 0
+    vacant = total if total_key in row else 0.0
+    vacant -= float(row.get(labels["owner_occupied_housing_units"], 0))
+    vacant -= float(row.get(labels["renter_occupied_housing_units"], 0))
+    return (vacant / total) * 100
+
+
 # Defines calculations that can be performed on raw Census data.
 # 'name': Human-readable name for the metric.
 # 'required_variables': List of keys from CENSUS_VARIABLE_MAP needed for the calculation.
-# 'calculation': A lambda function to compute the new value from a data row.
+# 'calculation': A function computing the new value from a data row and the metric's variable labels.
 DERIVED_METRICS_MAP = {
     "male_female_difference": {
         "name": "Male-Female Population Difference",
         "required_variables": ["male_population", "female_population"],
-        "calculation": lambda row, labels: float(row.get(labels["male_population"], 0)) - float(row.get(labels["female_population"], 0))
+        "calculation": _male_female_difference
     },
     "unemployment_percentage": {
         "name": "Unemployment Rate (%)",
         "required_variables": ["unemployment_rate", "employment_rate"],
-        "calculation": lambda row, labels: (float(row.get(labels["unemployment_rate"], 0)) / (float(row.get(labels["unemployment_rate"], 0)) + float(row.get(labels["employment_rate"], 0)))) * 100 if (float(row.get(labels["unemployment_rate"], 0)) + float(row.get(labels["employment_rate"], 0))) > 0 else 0
+        "calculation": _unemployment_percentage
     },
     "owner_occupied_percentage": {
         "name": "Owner-Occupied Housing Rate (%)",
         "required_variables": ["owner_occupied_housing_units", "total_housing_units"],
-        "calculation": lambda row, labels: (float(row.get(labels["owner_occupied_housing_units"], 0)) / float(row.get(labels["total_housing_units"], 1))) * 100 if float(row.get(labels["total_housing_units"], 1)) > 0 else 0
+        "calculation": _share_percentage("owner_occupied_housing_units", "total_housing_units")
     },
     "poverty_percentage": {
         "name": "Poverty Rate (%)",
         "required_variables": ["population_in_poverty", "total_population"],
-        "calculation": lambda row, labels: (float(row.get(labels["population_in_poverty"], 0)) / float(row.get(labels["total_population"], 1))) * 100 if float(row.get(labels["total_population"], 1)) > 0 else 0
+        "calculation": _share_percentage("population_in_poverty", "total_population")
     },
     "bachelors_degree_percentage": {
         "name": "Population with Bachelor's Degree or Higher (%)",
         "required_variables": ["population_with_bachelors_degree_or_higher", "total_population"],
-        "calculation": lambda row, labels: (float(row.get(labels["population_with_bachelors_degree_or_higher"], 0)) / float(row.get(labels["total_population"], 1))) * 100 if float(row.get(labels["total_population"], 1)) > 0 else 0
+        "calculation": _share_percentage("population_with_bachelors_degree_or_higher", "total_population")
     },
     "housing_vacancy_rate": {
         "name": "Housing Vacancy Rate (%)",
         "required_variables": ["total_housing_units", "owner_occupied_housing_units", "renter_occupied_housing_units"],
-        "calculation": lambda row, labels: ((float(row.get(labels["total_housing_units"], 0)) - float(row.get(labels["owner_occupied_housing_units"], 0)) - float(row.get(labels["renter_occupied_housing_units"], 0))) / float(row.get(labels["total_housing_units"], 1))) * 100 if float(row.get(labels["total_housing_units"], 1)) > 0 else 0
+        "calculation": _housing_vacancy_rate
     }
 }
@@ -1,5 +1,15 @@
+import logging
+
 from config import DERIVED_METRICS_MAP, CENSUS_VARIABLE_MAP
 
+logger = logging.getLogger(__name__)
+
+# Variable name -> Census code for each derived metric's inputs; these never change.
+_METRIC_LABELS = {
+    metric_key: {var_name: CENSUS_VARIABLE_MAP[var_name] for var_name in metric_info["required_variables"]}
+    for metric_key, metric_info in DERIVED_METRICS_MAP.items()
+}
+
 def enrich_data(data: list[dict], derived_metrics_to_calculate: list[str]) -> list[dict]:
     """
     Enriches raw Census data by calculating derived metrics.
@@ -14,22 +24,22 @@ def enrich_data(data: list[dict], derived_metrics_to_calculate: list[str]) -> li
     if not derived_metrics_to_calculate:
         return data
 
-    # Create a map from the human-readable variable name to its Census code
-    variable_code_map = {name: code for name, code in CENSUS_VARIABLE_MAP.items()}
+    # Resolve each requested metric once instead of per row
+    metrics = [
+        (metric_key, DERIVED_METRICS_MAP[metric_key]["calculation"], _METRIC_LABELS[metric_key])
+        for metric_key in derived_metrics_to_calculate
+        if metric_key in DERIVED_METRICS_MAP
+    ]
 
     enriched_data = []
     for row in data:
         new_row = row.copy()
-        for metric_key in derived_metrics_to_calculate:
-            if metric_key in DERIVED_METRICS_MAP:
-                metric_info = DERIVED_METRICS_MAP[metric_key]
-                # Create a dictionary of labels needed for this specific calculation
-                required_labels = {var_name: variable_code_map[var_name] for var_name in metric_info["required_variables"]}
-                try:
-                    # Pass the row and the required labels to the calculation function
-                    new_row[metric_key] = metric_info["calculation"](row, required_labels)
-                except Exception as e:
-                    print(f"Could not calculate metric '{metric_key}': {e}")
-                    new_row[metric_key] = None  # Set to None on failure
+        for metric_key, calculation, required_labels in metrics:
+            try:
+                # Pass the row and the required labels to the calculation function
+                new_row[metric_key] = calculation(row, required_labels)
+            except (TypeError, ValueError, ZeroDivisionError, KeyError) as e:
+                logger.debug("Could not calculate metric '%s': %s", metric_key, e)
+                new_row[metric_key] = None  # Set to None on failure
         enriched_data.append(new_row)
     return enriched_data
@@ -1,8 +1,6 @@
 """Shared configuration for Gemini model and Census tools."""
 from functools import lru_cache
-from typing import Dict
-
-from google.generativeai.types import FunctionDeclaration, Tool
+from typing import TYPE_CHECKING, Any, Dict
 
 from config import CENSUS_VARIABLE_MAP, DERIVED_METRICS_MAP, GEOGRAPHY_HIERARCHY
 
@@ -23,8 +21,14 @@ When users ask comparative or time-series questions, determine the appropriate v
 
 When the user wants to narrow or filter the existing dashboard view (top N, focus on a year, apply filters), call refine_dashboard_data with the previously returned payload before making a new Census API request."""
 
+if TYPE_CHECKING:
+    from google.generativeai.types import Tool
+
+
+def _build_get_demographic_data_tool() -> "Tool":
+    # Imported here so that importing this module does not pull in the Gemini SDK.
+    from google.generativeai.types import FunctionDeclaration, Tool
 
-def _build_get_demographic_data_tool() -> Tool:
     user_friendly_variable_names = list(CENSUS_VARIABLE_MAP.keys())
     geography_level_names = list(GEOGRAPHY_HIERARCHY.keys())
     derived_metric_names = list(DERIVED_METRICS_MAP.keys())
@@ -231,7 +235,17 @@ Always provide the raw_payload copied from the previous response if you plan to
     )
 
 
-CENSUS_TOOL = _build_get_demographic_data_tool()
+@lru_cache(maxsize=1)
+def get_census_tool() -> "Tool":
+    """Build the Census tool declarations on first use and reuse them afterwards."""
+    return _build_get_demographic_data_tool()
+
+
+def __getattr__(name: str) -> Any:
+    # Keep ``llm_config.CENSUS_TOOL`` working without building it at import time.
+    if name == "CENSUS_TOOL":
+        return get_census_tool()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @lru_cache(maxsize=1)
@@ -250,4 +264,4 @@ def get_variable_labels() -> Dict[str, str]:
     return labels.copy()
 
 
-__all__ = ["SYSTEM_INSTRUCTION", "CENSUS_TOOL", "get_variable_labels"]
+__all__ = ["SYSTEM_INSTRUCTION", "CENSUS_TOOL", "get_census_tool", "get_variable_labels"]
@@ -1,28 +1,55 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+from contextlib import asynccontextmanager
 from typing import Any, Dict, Optional
 
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 
 import ai_orchestrator # Import the new AI orchestrator - back to absolute since main.py is at package root
+from census_api_client import close_http_client
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+
+def _configure_logging() -> logging.handlers.QueueListener:
+    """Send log records through a queue so handler I/O runs off the event loop thread."""
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root_logger = logging.getLogger()
+    root_logger.setLevel(LOG_LEVEL)
+    root_logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = _configure_logging()
+logger = logging.getLogger(__name__)
 
 # Determine the environment - check for any production indicators
 env = os.getenv("ENVIRONMENT", "development")
 render_vars = os.getenv("RENDER") or os.getenv("RENDER_SERVICE_NAME") or os.getenv("RENDER_SERVICE_ID") or os.getenv("RENDER_EXTERNAL_HOSTNAME")
 
 # Debug logging to see what environment we're in
-print(f"Environment detected: {env}")
-print(f"Render vars: RENDER={os.getenv('RENDER')}, RENDER_SERVICE_NAME={os.getenv('RENDER_SERVICE_NAME')}")
-print(f"RENDER_SERVICE_ID={os.getenv('RENDER_SERVICE_ID')}, RENDER_EXTERNAL_HOSTNAME={os.getenv('RENDER_EXTERNAL_HOSTNAME')}")
+logger.info("Environment detected: %s", env)
+logger.info("Render vars: RENDER=%s, RENDER_SERVICE_NAME=%s", os.getenv("RENDER"), os.getenv("RENDER_SERVICE_NAME"))
+logger.info("RENDER_SERVICE_ID=%s, RENDER_EXTERNAL_HOSTNAME=%s", os.getenv("RENDER_SERVICE_ID"), os.getenv("RENDER_EXTERNAL_HOSTNAME"))
 
 # Check if we're on Render (production) - be more aggressive about detecting production
 is_production = render_vars or env == "production" or "render.com" in str(os.getenv("RENDER_EXTERNAL_HOSTNAME", ""))
 
 if is_production:
     # For production, variables are loaded from the hosting environment (Render)
-    print("Running in PRODUCTION mode")
+    logger.info("Running in PRODUCTION mode")
     origins = [
         "https://census-ai-frontend.onrender.com",
         "https://census-ai-frontend.onrender.com/",  # Include trailing slash variant
@@ -30,7 +57,7 @@ if is_production:
     ]
 else:
     # For local development, load variables from .env.development
-    print("Running in DEVELOPMENT mode")
+    logger.info("Running in DEVELOPMENT mode")
     load_dotenv(dotenv_path=".env.development")
     origins = [
         "http://localhost:5173",
@@ -40,17 +67,25 @@ else:
     ]
     
 
-print(f"CORS Origins configured: {origins}")
+logger.info("CORS Origins configured: %s", origins)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await close_http_client()
+    ai_orchestrator.shutdown_tool_executor()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Temporary request/response logging to diagnose 400 preflight errors
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    print(f"Incoming request: {request.method} {request.url}")
-    print(f"  Headers: {dict(request.headers)}")
+    logger.debug("Incoming request: %s %s", request.method, request.url)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("  Headers: %s", dict(request.headers))
     response = await call_next(request)
-    print(f"Response status: {response.status_code} for {request.method} {request.url}")
+    logger.debug("Response status: %s for %s %s", response.status_code, request.method, request.url)
     return response
 
 # CORS middleware configuration - more permissive for production debugging
@@ -63,7 +98,7 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-print("CORS middleware configured successfully")
+logger.info("CORS middleware configured successfully")
 
 @app.get("/")
 async def read_root():
@@ -77,6 +112,10 @@ class AskAIRequest(BaseModel):
         default=None,
         description="Optional conversational context payload captured on the frontend",
     )
+    conversation_id: Optional[str] = Field(
+        default=None,
+        description="Optional identifier used to keep the chat session between requests",
+    )
 
 
 @app.post("/ask_ai")
@@ -85,35 +124,42 @@ async def ask_ai(query_data: AskAIRequest):
     if not user_query:
         raise HTTPException(status_code=400, detail="Query cannot be empty")
 
-    print(f"Received query: {user_query}")
+    logger.info("Received query: %s", user_query)
     try:
         ai_response = await ai_orchestrator.get_ai_response(
             user_query,
             conversation_context=query_data.conversation_context,
+            conversation_id=query_data.conversation_id,
         )
         # Phase 3: ai_response is now a dict, not just a string
-        print(f"AI response: {ai_response}")
+        # The full payload can be thousands of rows; only format it when debugging.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("AI response: %s", ai_response)
         
         # Log token usage if available
         if isinstance(ai_response, dict) and "token_usage" in ai_response:
             token_info = ai_response["token_usage"]
-            print(f"Token usage - Prompt: {token_info.get('prompt_tokens', 0)}, "
-                  f"Completion: {token_info.get('completion_tokens', 0)}, "
-                  f"Total: {token_info.get('total_tokens', 0)}")
+            logger.info(
+                "Token usage - Prompt: %s, Completion: %s, Total: %s",
+                token_info.get("prompt_tokens", 0),
+                token_info.get("completion_tokens", 0),
+                token_info.get("total_tokens", 0),
+            )
         
-        return ai_response
+        # Hand the payload straight to orjson; responses are already JSON-native,
+        # so the jsonable_encoder pass FastAPI would otherwise run is skipped.
+        return ORJSONResponse(ai_response)
     except Exception as e:
-        print(f"Error during AI processing: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error during AI processing: %s", e)
         raise HTTPException(status_code=500, detail=f"Error processing your request with the AI: {str(e)}")
 
 @app.options("/ask_ai")
 async def ask_ai_options(request: Request) -> Response:
     """Handle CORS preflight requests and log headers for debugging."""
-    print("Received CORS preflight for /ask_ai with headers:")
-    for header, value in request.headers.items():
-        print(f"  {header}: {value}")
+    logger.debug("Received CORS preflight for /ask_ai with headers:")
+    if logger.isEnabledFor(logging.DEBUG):
+        for header, value in request.headers.items():
+            logger.debug("  %s: %s", header, value)
     return Response(status_code=200)
 
 
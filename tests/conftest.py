@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# The modules under test live at the repository root; make them importable when
+# pytest is run as a plain command rather than through `python -m pytest`.
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
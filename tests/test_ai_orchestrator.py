@@ -0,0 +1,169 @@
+"""Unit tests for the model-free helpers in ai_orchestrator."""
+
+import asyncio
+import threading
+
+import ai_orchestrator
+from ai_orchestrator import (
+    _is_json_native,
+    _normalize_tool_args,
+    build_dashboard_response,
+    build_query_prompt,
+    detect_intents,
+    detect_map_request,
+    detect_time_series_request,
+    guess_tool_args,
+    match_direct_query,
+    truncate_history,
+)
+
+
+def _state_rows():
+    return [
+        {"NAME": f"State {index}", "B01003_001E": str(index * 10), "state": f"{index:02d}"}
+        for index in range(1, 9)
+    ]
+
+
+def test_module_imports_without_building_the_model():
+    assert ai_orchestrator._model is None
+
+
+def test_normalize_tool_args_converts_nested_sequences_and_whole_floats():
+    args = _normalize_tool_args({"variables": ("total_population",), "year": 2020.0, "nested": {"limit": [5.0]}})
+
+    assert args == {"variables": ["total_population"], "year": 2020, "nested": {"limit": [5]}}
+
+
+def test_is_json_native_accepts_nested_plain_values_only():
+    assert _is_json_native([{"NAME": "Alpha", "values": [1, 2.5, None, True, {"nested": "ok"}]}])
+    assert not _is_json_native([{"NAME": "Alpha", "when": object()}])
+    assert not _is_json_native([{1: "non-string key"}])
+
+
+def test_truncate_history_drops_oldest_turns_over_the_token_budget():
+    history = [
+        {"role": "user", "parts": ["x" * 400]},
+        {"role": "model", "parts": ["short answer"]},
+        {"role": "user", "parts": ["follow-up"]},
+    ]
+
+    assert truncate_history(history, max_messages=6, token_budget=50) == history[1:]
+    assert truncate_history(history, max_messages=6, token_budget=1) == history[-1:]
+    assert truncate_history(history, max_messages=6, token_budget=0) == history
+
+
+def test_build_query_prompt_only_adds_context_preamble():
+    assert build_query_prompt("population by state") == "population by state"
+    prompt = build_query_prompt("top 5", {"dashboard_summary": "Population by state"})
+    assert prompt.endswith("New request: top 5")
+    assert "Current view: Population by state" in prompt
+
+
+def test_detect_map_request_keeps_substring_matches_and_flexible_spacing():
+    assert detect_map_request("Show   me income by county")
+    assert detect_map_request("maps of Texas")
+    assert not detect_map_request("what is the median age of Ohio?")
+
+
+def test_detect_time_series_request_uses_keywords_or_two_distinct_years():
+    assert detect_time_series_request("Population TREND in Ohio")
+    assert detect_time_series_request("income in 2012 vs 2022")
+    assert not detect_time_series_request("income in 2022 and 2022")
+    assert not detect_time_series_request("population of zip 20200 and 2019")
+
+
+def test_match_direct_query_routes_known_shapes_only():
+    assert match_direct_query("Show me population by state") == {
+        "geography_level": "state",
+        "variables": ["total_population"],
+    }
+    assert match_direct_query("median household income by county in New York?") == {
+        "geography_level": "county",
+        "variables": ["median_household_income"],
+        "state_name": "new york",
+    }
+    assert match_direct_query("population by county") is None
+    assert match_direct_query("population by county in Atlantis") is None
+    assert match_direct_query("why did population by state change") is None
+
+
+def test_detect_intents_agrees_with_the_single_intent_detectors():
+    for query in ("Show   me states over time", "map 2010 vs 2020", "zip 20200 and 2019", "charting", "chartrend", "hello"):
+        assert detect_intents(query) == (detect_map_request(query), detect_time_series_request(query))
+
+
+def test_guess_tool_args_finds_the_phrase_inside_longer_queries():
+    assert guess_tool_args("Could you show median age by county in New York over the years?") == {
+        "geography_level": "county",
+        "variables": ["median_age"],
+        "state_name": "new york",
+    }
+    assert guess_tool_args("ok, population by state please") == {
+        "geography_level": "state",
+        "variables": ["total_population"],
+    }
+    assert guess_tool_args("population by county in the region") is None
+    assert guess_tool_args("what is the population of Texas?") is None
+
+
+def test_build_dashboard_response_builds_chart_and_class_breaks():
+    response = build_dashboard_response(_state_rows(), {"geography_level": "state"}, 3, 4)
+
+    assert response["type"] == "dashboard_data"
+    assert response["metadata"]["display_variable_id"] == "B01003_001E"
+    assert response["metadata"]["class_breaks"] == [24.0, 38.0, 52.0, 66.0]
+    assert [entry["name"] for entry in response["charts"][0]["data"]] == [
+        "State 8", "State 7", "State 6", "State 5", "State 4",
+    ]
+    assert response["token_usage"] == {"prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7}
+
+
+def test_build_dashboard_response_reports_all_null_columns_without_insights():
+    rows = [{"NAME": "Alpha", "B01003_001E": None}, {"NAME": "Beta", "B01003_001E": ""}]
+
+    response = build_dashboard_response(rows, {"geography_level": "county"}, 0, 0)
+
+    assert response["insights"] == []
+    assert response["summary_text"].startswith("No ")
+    assert response["charts"] == []
+
+
+def test_chat_sessions_are_bounded_and_evicted_least_recently_used(monkeypatch):
+    monkeypatch.setattr(ai_orchestrator, "CHAT_SESSION_MAX", 2)
+    monkeypatch.setattr(ai_orchestrator, "_CHAT_SESSIONS", ai_orchestrator.OrderedDict())
+
+    ai_orchestrator._store_chat_session("a", "session-a")
+    ai_orchestrator._store_chat_session("b", "session-b")
+    ai_orchestrator._store_chat_session("a", "session-a")
+    ai_orchestrator._store_chat_session("c", "session-c")
+
+    assert ai_orchestrator._get_chat_session("b") is None
+    assert ai_orchestrator._get_chat_session("a") == "session-a"
+    assert ai_orchestrator._get_chat_session("c") == "session-c"
+
+
+def test_large_dashboards_are_built_on_the_tool_pool(monkeypatch):
+    monkeypatch.setattr(ai_orchestrator, "DASHBOARD_OFFLOAD_MIN_ROWS", 2)
+
+    def _builder(rows):
+        return threading.current_thread().name
+
+    async def _build(row_count):
+        return await ai_orchestrator._run_dashboard_builder(_builder, row_count, [])
+
+    assert asyncio.run(_build(2)).startswith("census-tool")
+    assert asyncio.run(_build(1)) == threading.current_thread().name
+
+
+def test_tool_pool_is_recreated_after_shutdown(monkeypatch):
+    monkeypatch.setattr(ai_orchestrator, "DASHBOARD_OFFLOAD_MIN_ROWS", 1)
+
+    async def _build():
+        return await ai_orchestrator._run_dashboard_builder(lambda rows: threading.current_thread().name, 1, [])
+
+    asyncio.run(_build())
+    ai_orchestrator.shutdown_tool_executor()
+
+    # A second app lifespan in the same process must still be able to run tools.
+    assert asyncio.run(_build()).startswith("census-tool")
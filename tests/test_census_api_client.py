@@ -0,0 +1,151 @@
+"""Unit tests for the Census API client's request building, coalescing and retries."""
+
+import asyncio
+
+import httpx
+import pytest
+
+import census_api_client
+
+
+class _FakeCensusAPI:
+    """Answers Census requests from a script of responses, then with one default table."""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        self.delays = []
+        self.hang = False
+        self.hanging = None
+        self.cancelled = 0
+
+    async def handle(self, request):
+        self.requests.append(request)
+        if self.hang:
+            self.hanging.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        if self.responses:
+            return self.responses.pop(0)
+        return httpx.Response(200, json=[["NAME", "B01003_001E", "state"], ["Alpha", "100", "01"]])
+
+    async def sleep(self, delay):
+        self.delays.append(delay)
+
+
+@pytest.fixture()
+def census_api(monkeypatch):
+    fake = _FakeCensusAPI()
+    monkeypatch.setenv("CENSUS_API_KEY", "test-key")
+    monkeypatch.setattr(census_api_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(fake.handle)))
+    # Retry backoff is recorded instead of slept.
+    monkeypatch.setattr(census_api_client.asyncio, "sleep", fake.sleep)
+    return fake
+
+
+def _get(**kwargs):
+    return asyncio.run(census_api_client.CensusAPIClient().get_acs5_data(**kwargs))
+
+
+def test_parent_geographies_become_repeated_in_parameters(census_api):
+    records = _get(year=2022, variables=["NAME", "B01003_001E"], for_geo="tract:*", in_geos={"state": "06", "county": "037"})
+
+    assert records == [{"NAME": "Alpha", "B01003_001E": "100", "state": "01"}]
+    params = census_api.requests[0].url.params
+    assert params.get_list("in") == ["state:06", "county:037"]
+    assert params["for"] == "tract:*"
+    assert params["key"] == "test-key"
+
+
+def test_concurrent_identical_requests_share_one_fetch(census_api):
+    async def _get_twice():
+        client = census_api_client.CensusAPIClient()
+        return await asyncio.gather(
+            client.get_acs5_data(year=2022, variables=["NAME"], for_geo="state:*"),
+            client.get_acs5_data(year=2022, variables=["NAME"], for_geo="state:*"),
+        )
+
+    first, second = asyncio.run(_get_twice())
+
+    assert len(census_api.requests) == 1
+    assert first == second
+    assert first[0] is not second[0]
+    assert census_api_client._INFLIGHT_REQUESTS == {}
+
+
+def test_a_caller_fetching_alone_gets_the_fetched_rows_uncopied(census_api, monkeypatch):
+    fetched = [{"NAME": "Alpha"}]
+
+    async def _request_records(self, *args):
+        return fetched
+
+    monkeypatch.setattr(census_api_client.CensusAPIClient, "_request_records", _request_records)
+
+    assert _get(year=2022, variables=["NAME"], for_geo="state:*") is fetched
+
+
+def test_fetch_is_cancelled_only_when_every_caller_is(census_api):
+    census_api.hang = True
+
+    async def _cancel_callers():
+        census_api.hanging = asyncio.Event()
+        client = census_api_client.CensusAPIClient()
+        callers = [
+            asyncio.ensure_future(client.get_acs5_data(year=2022, variables=["NAME"], for_geo="state:*"))
+            for _ in range(2)
+        ]
+        await census_api.hanging.wait()
+        (fetch_task,) = census_api_client._INFLIGHT_REQUESTS.values()
+
+        callers[0].cancel()
+        await asyncio.gather(callers[0], return_exceptions=True)
+        still_running = not fetch_task.done()
+
+        callers[1].cancel()
+        await asyncio.wait([callers[1], fetch_task], timeout=1)
+        return still_running, fetch_task.cancelled()
+
+    assert asyncio.run(_cancel_callers()) == (True, True)
+    assert census_api.cancelled == 1
+    assert census_api_client._FETCH_WAITERS == {}
+
+
+def test_get_acs5_data_many_returns_results_in_request_order(census_api):
+    requests = [
+        {"year": 2021, "variables": ["NAME"], "for_geo": "state:*"},
+        {"year": 2022, "variables": [], "for_geo": "state:*"},
+        {"year": 2020, "variables": ["NAME"], "for_geo": "state:*"},
+    ]
+
+    results = asyncio.run(census_api_client.CensusAPIClient().get_acs5_data_many(requests))
+
+    assert results[1] == []
+    assert results[0] == results[2] == [{"NAME": "Alpha", "B01003_001E": "100", "state": "01"}]
+    assert sorted(request.url.path.split("/")[2] for request in census_api.requests) == ["2020", "2021"]
+
+
+def test_rate_limited_responses_are_retried_honouring_retry_after(census_api):
+    census_api.responses = [httpx.Response(429, headers={"Retry-After": "2"}), httpx.Response(503)]
+
+    assert _get(year=2022, variables=["NAME"], for_geo="state:*") == [{"NAME": "Alpha", "B01003_001E": "100", "state": "01"}]
+    assert len(census_api.requests) == 3
+    assert census_api.delays[0] == 2.0
+    assert 2 <= census_api.delays[1] <= 2.5
+
+
+def test_retries_give_up_with_an_empty_result(census_api, monkeypatch):
+    monkeypatch.setattr(census_api_client, "CENSUS_RETRY_ATTEMPTS", 3)
+    census_api.responses = [httpx.Response(502)] * 3
+
+    assert _get(year=2022, variables=["NAME"], for_geo="state:*") == []
+    assert len(census_api.requests) == 3
+
+
+def test_duplicate_variables_and_for_geo_spelling_are_canonicalized(census_api):
+    _get(year=2022, variables=["NAME", "B01003_001E", "NAME"], for_geo=" State:* ")
+
+    assert census_api.requests[0].url.params["get"] == "NAME,B01003_001E"
+    assert census_api.requests[0].url.params["for"] == "state:*"
@@ -0,0 +1,158 @@
+"""Unit tests for per-conversation chat sessions kept between requests."""
+
+import asyncio
+
+import pytest
+import google.generativeai as genai
+from google.generativeai import protos
+from google.generativeai.types import generation_types
+
+import ai_orchestrator
+
+
+def _function_call_turn(name="get_demographic_data"):
+    return {"role": "model", "parts": [{"function_call": {"name": name, "args": {"geography_level": "state"}}}]}
+
+
+class _FakeModel:
+    def __init__(self):
+        self.started = []
+
+    def start_chat(self, history=None):
+        chat_session = genai.ChatSession(model=None, history=history)
+        self.started.append(chat_session)
+        return chat_session
+
+
+@pytest.fixture()
+def fake_model(monkeypatch):
+    model = _FakeModel()
+    monkeypatch.setattr(ai_orchestrator, "_get_model", lambda: model)
+    monkeypatch.setattr(ai_orchestrator, "_CHAT_SESSIONS", ai_orchestrator.OrderedDict())
+    monkeypatch.setattr(ai_orchestrator, "_CHAT_SESSION_LOCKS", {})
+    monkeypatch.setattr(ai_orchestrator, "RESPONSE_CACHE_SIZE", 0)
+    monkeypatch.setattr(ai_orchestrator, "DIRECT_QUERY_ROUTING", False)
+    return model
+
+
+def _answer_with_dashboard(monkeypatch):
+    """Stand in for the model turn: the model asks for a tool and a dashboard is returned."""
+
+    async def _generate(user_query, chat_session, conversation_context=None, tried_tool_args=None):
+        chat_session.history = [*chat_session.history, {"role": "user", "parts": [user_query]}, _function_call_turn()]
+        return {"type": "dashboard_data", "summary_text": f"Dashboard for {user_query}"}
+
+    monkeypatch.setattr(ai_orchestrator, "_generate_ai_response", _generate)
+
+
+def test_conversation_reuses_its_session_and_keeps_the_data_turn(fake_model, monkeypatch):
+    monkeypatch.setattr(ai_orchestrator, "DEFAULT_HISTORY_LIMIT", 8)
+    _answer_with_dashboard(monkeypatch)
+
+    asyncio.run(ai_orchestrator.get_ai_response("population by state", conversation_id="c1"))
+    asyncio.run(ai_orchestrator.get_ai_response("now do Texas", conversation_id="c1"))
+
+    assert len(fake_model.started) == 1
+    history = fake_model.started[0].history
+    assert [content.role for content in history] == ["user", "model", "user", "model"] * 2
+    assert history[2].parts[0].function_response.name == "get_demographic_data"
+    assert history[3].parts[0].text == "Dashboard for population by state"
+
+
+def test_expired_session_is_rebuilt_from_client_history(fake_model, monkeypatch):
+    _answer_with_dashboard(monkeypatch)
+    asyncio.run(ai_orchestrator.get_ai_response("population by state", conversation_id="c1"))
+    monkeypatch.setattr(ai_orchestrator, "CHAT_SESSION_TTL_SECONDS", -1)
+
+    client_history = [{"role": "user", "parts": ["earlier question"]}, {"role": "model", "parts": ["earlier answer"]}]
+    asyncio.run(ai_orchestrator.get_ai_response("income by state", chat_history=client_history, conversation_id="c1"))
+
+    assert len(fake_model.started) == 2
+    assert fake_model.started[1].history[0].parts[0].text == "earlier question"
+
+
+def test_broken_stream_is_rewound_and_the_session_kept(fake_model, monkeypatch):
+    _answer_with_dashboard(monkeypatch)
+    asyncio.run(ai_orchestrator.get_ai_response("population by state", conversation_id="c1"))
+
+    async def _blocked(user_query, chat_session, conversation_context=None, tried_tool_args=None):
+        chat_session.history  # settle any pending turn, as send_message_async does
+        chat_session._last_sent = protos.Content(role="user", parts=[{"text": user_query}])
+        chat_session._last_received = generation_types.GenerateContentResponse.from_response(
+            protos.GenerateContentResponse(
+                candidates=[{"content": {"role": "model", "parts": [{"text": "par"}]}, "finish_reason": "SAFETY"}]
+            )
+        )
+        return {"response": "Sorry, there was a critical error in the AI orchestration."}
+
+    monkeypatch.setattr(ai_orchestrator, "_generate_ai_response", _blocked)
+    response = asyncio.run(ai_orchestrator.get_ai_response("something unsafe", conversation_id="c1"))
+
+    assert response["response"].startswith("Sorry")
+    chat_session = ai_orchestrator._get_chat_session("c1")
+    assert chat_session is fake_model.started[0]
+    assert len(chat_session.history) == 4
+
+
+def test_unrepairable_session_is_dropped(fake_model, monkeypatch):
+    class _Unrepairable:
+        broken = False
+
+        @property
+        def history(self):
+            if self.broken:
+                raise RuntimeError("broken")
+            return [{"role": "user", "parts": ["hi"]}]
+
+        def rewind(self):
+            raise RuntimeError("still broken")
+
+    async def _generate(user_query, chat_session, conversation_context=None, tried_tool_args=None):
+        chat_session.broken = True
+        return {"response": "ok"}
+
+    monkeypatch.setattr(ai_orchestrator, "_generate_ai_response", _generate)
+    ai_orchestrator._store_chat_session("c1", _Unrepairable())
+    lock = ai_orchestrator._CHAT_SESSION_LOCKS.setdefault("c1", asyncio.Lock())
+
+    assert asyncio.run(ai_orchestrator.get_ai_response("hello", conversation_id="c1")) == {"response": "ok"}
+    assert ai_orchestrator._get_chat_session("c1") is None
+    # Requests queued on the conversation's lock must keep serializing with newcomers.
+    assert ai_orchestrator._CHAT_SESSION_LOCKS["c1"] is lock
+
+
+def test_history_cap_never_starts_inside_a_tool_exchange(monkeypatch):
+    monkeypatch.setattr(ai_orchestrator, "DEFAULT_HISTORY_LIMIT", 4)
+    chat_session = genai.ChatSession(model=None, history=[])
+    chat_session.history = [
+        {"role": "user", "parts": ["population by state"]},
+        _function_call_turn(),
+        {"role": "user", "parts": [{"function_response": {"name": "get_demographic_data", "response": {"content": {}}}}]},
+        {"role": "model", "parts": ["Dashboard"]},
+        {"role": "user", "parts": ["thanks"]},
+        {"role": "model", "parts": ["You're welcome"]},
+    ]
+
+    assert ai_orchestrator._settle_chat_session(chat_session)
+
+    # The last four turns would start at the function response, so the whole exchange goes.
+    assert [content.parts[0].text for content in chat_session.history] == ["thanks", "You're welcome"]
+
+
+def test_directly_answered_turn_is_recorded_in_the_live_session(fake_model, monkeypatch):
+    monkeypatch.setattr(ai_orchestrator, "DEFAULT_HISTORY_LIMIT", 8)
+    _answer_with_dashboard(monkeypatch)
+    asyncio.run(ai_orchestrator.get_ai_response("income in ohio counties", conversation_id="c1"))
+
+    async def _fake_get_demographic_data(**kwargs):
+        return [{"NAME": "Alpha", "B01003_001E": "100", "state": "01"}]
+
+    monkeypatch.setattr(ai_orchestrator, "get_demographic_data", _fake_get_demographic_data)
+    monkeypatch.setattr(ai_orchestrator, "DIRECT_QUERY_ROUTING", True)
+    response = asyncio.run(ai_orchestrator.get_ai_response("population by state", conversation_id="c1"))
+
+    history = ai_orchestrator._get_chat_session("c1").history
+    assert [content.role for content in history] == ["user", "model", "user", "model"] * 2
+    assert history[4].parts[0].text == "population by state"
+    assert history[5].parts[0].function_call.args["geography_level"] == "state"
+    assert history[7].parts[0].text == response["summary_text"]
@@ -0,0 +1,35 @@
+"""Unit tests for derived-metric enrichment."""
+
+from data_enricher import enrich_data
+
+
+def test_enrich_data_adds_requested_metrics_and_skips_unknown_ones():
+    rows = [
+        {"NAME": "Alpha", "B17001_002E": "25", "B01003_001E": "200"},
+        {"NAME": "Beta", "B17001_002E": "10", "B01003_001E": "0"},
+    ]
+
+    enriched = enrich_data(rows, ["poverty_percentage", "not_a_metric"])
+
+    assert [row["poverty_percentage"] for row in enriched] == [12.5, 0]
+    assert "not_a_metric" not in enriched[0]
+    assert "poverty_percentage" not in rows[0]
+
+
+def test_enrich_data_sets_none_when_a_metric_cannot_be_calculated():
+    enriched = enrich_data([{"NAME": "Alpha", "B17001_002E": "n/a", "B01003_001E": "200"}], ["poverty_percentage"])
+
+    assert enriched[0]["poverty_percentage"] is None
+
+
+def test_rate_metrics_guard_against_empty_denominators():
+    rows = [
+        {"B23025_005E": "5", "B23025_004E": "95", "B25001_001E": "200", "B25003_002E": "120", "B25003_003E": "60"},
+        {"B23025_005E": "0", "B23025_004E": "0", "B25001_001E": "0", "B25003_002E": "0", "B25003_003E": "0"},
+    ]
+
+    enriched = enrich_data(rows, ["unemployment_percentage", "housing_vacancy_rate", "owner_occupied_percentage"])
+
+    assert [row["unemployment_percentage"] for row in enriched] == [5.0, 0]
+    assert [row["housing_vacancy_rate"] for row in enriched] == [10.0, 0]
+    assert [row["owner_occupied_percentage"] for row in enriched] == [60.0, 0]
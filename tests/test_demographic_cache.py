@@ -0,0 +1,45 @@
+"""Unit tests for the in-process get_demographic_data result cache."""
+
+import asyncio
+
+import pytest
+
+import tools
+
+
+@pytest.fixture()
+def fake_fetch(monkeypatch):
+    calls = []
+
+    async def _fake_fetch_year_data(request_config, year):
+        calls.append(year)
+        return year, [{"NAME": "Alpha", "B01003_001E": "100", "state": "01"}]
+
+    monkeypatch.setattr(tools, "_fetch_year_data", _fake_fetch_year_data)
+    monkeypatch.setattr(tools, "CENSUS_API_KEY", "test-key")
+    monkeypatch.setattr(tools, "_DEMOGRAPHIC_DATA_CACHE", tools.OrderedDict())
+    return calls
+
+
+def test_repeated_request_is_served_from_cache(fake_fetch):
+    first = asyncio.run(tools.get_demographic_data("state", variables=["total_population"]))
+    second = asyncio.run(tools.get_demographic_data("state", variables=["total_population"]))
+
+    assert fake_fetch == [tools.DEFAULT_ACS_YEAR]
+    assert second == first
+
+
+def test_cached_rows_are_not_shared_with_callers(fake_fetch):
+    first = asyncio.run(tools.get_demographic_data("state", variables=["total_population"]))
+    first[0]["B01003_001E"] = "mutated"
+
+    second = asyncio.run(tools.get_demographic_data("state", variables=["total_population"]))
+
+    assert second[0]["B01003_001E"] == "100"
+
+
+def test_different_years_are_cached_separately(fake_fetch):
+    asyncio.run(tools.get_demographic_data("state", variables=["total_population"], year=2020))
+    asyncio.run(tools.get_demographic_data("state", variables=["total_population"], year=2021))
+
+    assert fake_fetch == [2020, 2021]
@@ -7,7 +7,12 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from tools import _compute_time_series_metrics, calculate_summary_statistics
+from tools import (
+    _compute_time_series_metrics,
+    calculate_class_breaks,
+    calculate_summary_statistics,
+    calculate_summary_statistics_batch,
+)
 
 
 def test_compute_time_series_metrics_basic_growth():
@@ -56,3 +61,30 @@ def test_calculate_summary_statistics_returns_expected_values():
     assert stats["median"] == pytest.approx(150.0)
     assert stats["min_entity_name"] == "Region A"
     assert stats["max_entity_name"] == "Region C"
+
+
+def test_calculate_summary_statistics_batch_matches_single_variable_results():
+    data = [
+        {"NAME": "Region A", "B01003_001E": "100", "B19013_001E": "50,000"},
+        {"NAME": "Region B", "B01003_001E": 150, "B19013_001E": None},
+        {"NAME": "Region C", "B01003_001E": "200", "B19013_001E": "70000"},
+    ]
+
+    batch = calculate_summary_statistics_batch(data, ["B01003_001E", "B19013_001E", "B25077_001E"])
+
+    assert batch["B01003_001E"] == calculate_summary_statistics(data, "B01003_001E")
+    assert batch["B19013_001E"] == calculate_summary_statistics(data, "B19013_001E")
+    assert batch["B19013_001E"]["count"] == 2
+    assert "B25077_001E" not in batch
+
+
+def test_calculate_class_breaks_returns_quantile_cut_points():
+    values = [10.0, None, 20.0, 30.0, 40.0, 50.0]
+
+    breaks = calculate_class_breaks(values, class_count=4)
+
+    assert breaks == pytest.approx([20.0, 30.0, 40.0])
+
+
+def test_calculate_class_breaks_needs_at_least_two_values():
+    assert calculate_class_breaks([None, 5.0]) == []
@@ -0,0 +1,248 @@
+"""Unit tests for streamed tool dispatch and response caching in ai_orchestrator, driven by a scripted fake model."""
+
+import asyncio
+
+import pytest
+from google.generativeai import protos
+
+import ai_orchestrator
+
+
+def _function_call(name, **args):
+    return {"function_call": {"name": name, "args": args}}
+
+
+def _chunk(*parts):
+    return protos.GenerateContentResponse(candidates=[{"content": {"role": "model", "parts": list(parts)}}])
+
+
+class _FakeStream:
+    usage_metadata = None
+
+    def __init__(self, chunks, error=None):
+        self._chunks = chunks
+        self._error = error
+        # What the SDK exposes once the stream is drained: every chunk's parts merged.
+        merged = [part for chunk in chunks for part in chunk.candidates[0].content.parts]
+        self.candidates = [protos.Candidate(content={"role": "model", "parts": merged})]
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            yield chunk
+            await asyncio.sleep(0)
+        if self._error is not None:
+            raise self._error
+
+
+class _FakeChatSession:
+    """Replays one scripted stream per send and records what was sent."""
+
+    def __init__(self, *streams):
+        self._streams = list(streams)
+        self.sent = []
+        self.history = []
+        self.send_kwargs = []
+
+    async def send_message_async(self, content, stream=False, **kwargs):
+        self.sent.append(content)
+        self.send_kwargs.append(kwargs)
+        return self._streams.pop(0)
+
+
+class _ToolRecorder:
+    def __init__(self):
+        self.calls = []
+        self.cancelled = []
+        self.hanging_levels = set()
+        self.empty_levels = set()
+
+    async def get_demographic_data(self, **kwargs):
+        self.calls.append(kwargs)
+        try:
+            if kwargs.get("geography_level") in self.hanging_levels:
+                await asyncio.Event().wait()
+            if kwargs.get("geography_level") in self.empty_levels:
+                return []
+            place = kwargs.get("state_name", "us")
+            return [
+                {"NAME": f"{place} Alpha", "B01003_001E": "100", "state": "01"},
+                {"NAME": f"{place} Beta", "B01003_001E": "200", "state": "02"},
+            ]
+        except asyncio.CancelledError:
+            self.cancelled.append(kwargs)
+            raise
+
+
+@pytest.fixture()
+def tools(monkeypatch):
+    """Replace the Census tool with a recording fake; calls for hanging levels never finish
+    and calls for empty levels find no rows."""
+    recorder = _ToolRecorder()
+    monkeypatch.setattr(ai_orchestrator, "get_demographic_data", recorder.get_demographic_data)
+    monkeypatch.setitem(ai_orchestrator.AVAILABLE_FUNCTIONS, "get_demographic_data", (recorder.get_demographic_data, True))
+    monkeypatch.setattr(ai_orchestrator, "DIRECT_QUERY_ROUTING", False)
+    return recorder
+
+
+def test_tools_started_before_a_stream_failure_are_cancelled(tools):
+    tools.hanging_levels.add("county")
+    chat_session = _FakeChatSession(
+        _FakeStream(
+            [_chunk(_function_call("get_demographic_data", geography_level="county", variables=["total_population"], state_name="ohio"))],
+            error=RuntimeError("stream reset"),
+        )
+    )
+
+    async def _dispatch():
+        with pytest.raises(RuntimeError):
+            await ai_orchestrator._stream_and_dispatch_tools(chat_session, "query")
+        # Checked before asyncio.run tears the loop down and cancels leftovers itself.
+        return list(tools.cancelled)
+
+    assert asyncio.run(_dispatch()) == tools.calls
+    assert len(tools.calls) == 1
+
+
+def test_speculative_call_is_reused_when_the_model_asks_for_it(tools):
+    chat_session = _FakeChatSession(
+        _FakeStream([_chunk(_function_call("get_demographic_data", geography_level="State", variables=["total_population"]))])
+    )
+
+    response = asyncio.run(ai_orchestrator._generate_ai_response("Show me population by state please", chat_session))
+
+    assert response["type"] == "dashboard_data"
+    assert tools.calls == [{"geography_level": "state", "variables": ["total_population"]}]
+    assert len(chat_session.sent) == 1
+
+
+def test_mismatched_speculative_call_is_cancelled(tools):
+    tools.hanging_levels.add("state")
+    chat_session = _FakeChatSession(
+        _FakeStream([_chunk(_function_call("get_demographic_data", geography_level="county", variables=["total_population"], state_name="ohio"))])
+    )
+
+    async def _answer():
+        response = await ai_orchestrator._generate_ai_response("Show me population by state, no wait, Ohio counties", chat_session)
+        await asyncio.sleep(0)  # let the cancellation reach the discarded task
+        return response, list(tools.cancelled)
+
+    response, cancelled = asyncio.run(_answer())
+
+    assert response["type"] == "dashboard_data"
+    assert [call["geography_level"] for call in tools.calls] == ["state", "county"]
+    assert cancelled == [{"geography_level": "state", "variables": ["total_population"]}]
+
+
+def test_parallel_tool_calls_run_once_each_and_answer_in_call_order(tools):
+    chat_session = _FakeChatSession(
+        _FakeStream([
+            _chunk(_function_call("get_demographic_data", geography_level="county", variables=["total_population"], state_name="ohio")),
+            _chunk(_function_call("get_demographic_data", geography_level="county", variables=["total_population"], state_name="texas")),
+        ]),
+        _FakeStream([_chunk({"text": "Texas counties "}), _chunk({"text": "are larger."})]),
+    )
+
+    response = asyncio.run(ai_orchestrator._generate_ai_response("compare ohio and texas counties", chat_session))
+
+    assert response["response"] == "Texas counties are larger."
+    assert [call["state_name"] for call in tools.calls] == ["ohio", "texas"]
+    function_responses = chat_session.sent[1]
+    assert [entry["function_response"]["name"] for entry in function_responses] == ["get_demographic_data"] * 2
+    assert [entry["function_response"]["response"]["content"]["samples"][0]["NAME"] for entry in function_responses] == [
+        "ohio Alpha", "texas Alpha",
+    ]
+
+
+class _FakeModel:
+    def __init__(self, *chat_sessions):
+        self._chat_sessions = list(chat_sessions)
+        self.started = 0
+
+    def start_chat(self, history=None):
+        self.started += 1
+        return self._chat_sessions.pop(0)
+
+
+@pytest.fixture()
+def response_cache(monkeypatch):
+    monkeypatch.setattr(ai_orchestrator, "_RESPONSE_CACHE", ai_orchestrator.OrderedDict())
+    monkeypatch.setattr(ai_orchestrator, "_CHAT_SESSIONS", ai_orchestrator.OrderedDict())
+    monkeypatch.setattr(ai_orchestrator, "_CHAT_SESSION_LOCKS", {})
+
+    def _use_model(*chat_sessions):
+        model = _FakeModel(*chat_sessions)
+        monkeypatch.setattr(ai_orchestrator, "_get_model", lambda: model)
+        return model
+
+    return _use_model
+
+
+def _dashboard_session():
+    return _FakeChatSession(
+        _FakeStream([_chunk(_function_call("get_demographic_data", geography_level="state", variables=["total_population"]))])
+    )
+
+
+def test_repeated_dashboard_query_is_served_from_the_response_cache(tools, response_cache):
+    model = response_cache(_dashboard_session())
+
+    first = asyncio.run(ai_orchestrator.get_ai_response("Map population by state"))
+    second = asyncio.run(ai_orchestrator.get_ai_response("  map POPULATION by state "))
+
+    assert model.started == 1
+    assert len(tools.calls) == 1
+    assert second["charts"] == first["charts"]
+    assert second["token_usage"]["total_tokens"] == 0
+
+
+def test_text_answers_and_live_sessions_bypass_the_response_cache(tools, response_cache):
+    model = response_cache(
+        _FakeChatSession(_FakeStream([_chunk({"text": "Hello!"})])),
+        _FakeChatSession(_FakeStream([_chunk({"text": "Hello again!"})])),
+        _dashboard_session(),
+    )
+
+    assert asyncio.run(ai_orchestrator.get_ai_response("hello"))["response"] == "Hello!"
+    assert asyncio.run(ai_orchestrator.get_ai_response("hello"))["response"] == "Hello again!"
+
+    # Cached by a stateless request, but a conversation with a live session goes to its session.
+    asyncio.run(ai_orchestrator.get_ai_response("Map population by state"))
+    ai_orchestrator._store_chat_session("c1", _dashboard_session())
+    asyncio.run(ai_orchestrator.get_ai_response("Map population by state", conversation_id="c1"))
+
+    assert model.started == 3
+    assert len(tools.calls) == 2
+
+
+def test_only_explicit_visualization_requests_force_a_tool_call(tools):
+    conceptual = _FakeChatSession(_FakeStream([_chunk({"text": "Coastal metros pay more."})]))
+    asyncio.run(ai_orchestrator._generate_ai_response("Why is median income higher in coastal states?", conceptual))
+
+    explicit = _dashboard_session()
+    asyncio.run(ai_orchestrator._generate_ai_response("Map population by state", explicit))
+
+    assert conceptual.send_kwargs == [{}]
+    assert explicit.send_kwargs == [{"tool_config": ai_orchestrator.FORCED_TOOL_CONFIG}]
+
+
+def test_multi_row_results_without_map_intent_get_an_interpreted_answer(tools):
+    chat_session = _FakeChatSession(
+        _FakeStream([_chunk(_function_call("get_demographic_data", geography_level="state", variables=["total_population"]))]),
+        _FakeStream([_chunk({"text": "New York is larger."})]),
+    )
+
+    response = asyncio.run(ai_orchestrator._generate_ai_response("How do New York and New Jersey compare?", chat_session))
+
+    assert response["response"] == "New York is larger."
+    assert len(tools.calls) == 1
+
+
+def test_request_the_direct_route_found_empty_is_not_speculated_again(tools, response_cache, monkeypatch):
+    monkeypatch.setattr(ai_orchestrator, "DIRECT_QUERY_ROUTING", True)
+    tools.empty_levels.add("state")
+    response_cache(_FakeChatSession(_FakeStream([_chunk({"text": "No state data is available."})])))
+
+    response = asyncio.run(ai_orchestrator.get_ai_response("Map population by state"))
+
+    assert response["response"] == "No state data is available."
+    assert tools.calls == [{"geography_level": "state", "variables": ["total_population"]}]
@@ -4,6 +4,9 @@ from data_enricher import enrich_data
 import asyncio
 import copy
 import os
+import statistics
+import time
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
@@ -14,7 +17,11 @@ DEFAULT_ACS_YEAR = int(os.getenv("DEFAULT_ACS_YEAR", "2022"))
 MIN_ACS_YEAR = int(os.getenv("MIN_ACS_YEAR", "2010"))
 MAX_ACS_YEAR = int(os.getenv("MAX_ACS_YEAR", str(DEFAULT_ACS_YEAR)))
 
+DEMOGRAPHIC_CACHE_SIZE = int(os.getenv("DEMOGRAPHIC_CACHE_SIZE", "512"))
+DEMOGRAPHIC_CACHE_TTL_SECONDS = float(os.getenv("DEMOGRAPHIC_CACHE_TTL_SECONDS", "3600"))
+
 _TIME_SERIES_CACHE: Dict[str, Dict[str, Any]] = {}
+_DEMOGRAPHIC_DATA_CACHE: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
 
 
 def _coerce_numeric(value: Any) -> Optional[float]:
@@ -163,13 +170,17 @@ def _normalize_geography_level(geography_level: str | None) -> str:
 
 
 def _safe_float(value: Any) -> Optional[float]:
-    try:
-        if isinstance(value, (int, float)):
-            return float(value)
-        if isinstance(value, str) and value.strip():
-            return float(value.replace(",", ""))
-    except (TypeError, ValueError):
-        return None
+    # Census cells are almost always numeric strings, so parse those first and only strip
+    # thousands separators when there are any. float() ignores surrounding whitespace.
+    if isinstance(value, str):
+        if not value:
+            return None
+        try:
+            return float(value.replace(",", "") if "," in value else value)
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)):
+        return float(value)
     return None
 
 
@@ -307,32 +318,63 @@ def _build_census_request(
     return request_config, None
 
 
-def _time_series_cache_key(config: Dict[str, Any], start_year: int, end_year: int) -> str:
-    key_parts = (
+def _request_key_parts(config: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (
         config.get("normalized_geography_level", ""),
         config.get("state_name") or "",
         config.get("county_name") or "",
         config.get("place_name") or "",
+        config.get("tract_code") or "",
+        config.get("block_group_code") or "",
         config.get("zip_code_tabulation_area") or "",
         tuple(config.get("normalized_variables", [])),
         tuple(config.get("derived_metrics", [])),
-        start_year,
-        end_year,
     )
-    return str(key_parts)
+
+
+def _time_series_cache_key(config: Dict[str, Any], start_year: int, end_year: int) -> str:
+    return str((*_request_key_parts(config), start_year, end_year))
+
+
+def _get_cached_demographic_data(cache_key: str) -> Optional[List[Dict[str, Any]]]:
+    cached = _DEMOGRAPHIC_DATA_CACHE.get(cache_key)
+    if cached is None:
+        return None
+    stored_at, rows = cached
+    if time.monotonic() - stored_at > DEMOGRAPHIC_CACHE_TTL_SECONDS:
+        _DEMOGRAPHIC_DATA_CACHE.pop(cache_key, None)
+        return None
+    _DEMOGRAPHIC_DATA_CACHE.move_to_end(cache_key)
+    # Rows hold only scalars, so per-row copies are enough to protect the cached entry.
+    return [dict(row) for row in rows]
+
+
+def _store_demographic_data(cache_key: str, rows: List[Dict[str, Any]]) -> None:
+    _DEMOGRAPHIC_DATA_CACHE[cache_key] = (time.monotonic(), [dict(row) for row in rows])
+    _DEMOGRAPHIC_DATA_CACHE.move_to_end(cache_key)
+    while len(_DEMOGRAPHIC_DATA_CACHE) > DEMOGRAPHIC_CACHE_SIZE:
+        _DEMOGRAPHIC_DATA_CACHE.popitem(last=False)
+
+
+def _acs_request(request_config: Dict[str, Any], year: int) -> Dict[str, Any]:
+    return {
+        "year": year,
+        "variables": request_config["required_census_vars"],
+        "for_geo": request_config["for_query"],
+        "in_geos": request_config["in_queries"] or None,
+    }
+
+
+def _enrich_year_data(request_config: Dict[str, Any], data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if request_config["derived_metrics"]:
+        return enrich_data(data, request_config["derived_metrics"])
+    return data
 
 
 async def _fetch_year_data(request_config: Dict[str, Any], year: int) -> Tuple[int, List[Dict[str, Any]]]:
     client = CensusAPIClient()
-    data = await client.get_acs5_data(
-        year=year,
-        variables=request_config["required_census_vars"],
-        for_geo=request_config["for_query"],
-        in_geos=request_config["in_queries"] or None,
-    )
-    if request_config["derived_metrics"]:
-        data = enrich_data(data, request_config["derived_metrics"])
-    return year, data
+    data = await client.get_acs5_data(**_acs_request(request_config, year))
+    return year, _enrich_year_data(request_config, data)
 
 
 def _compose_geo_identifier(row: Dict[str, Any], normalized_geo_level: str) -> Tuple[str, Dict[str, Any]]:
@@ -470,8 +512,16 @@ async def get_demographic_data(
     if not CENSUS_API_KEY:
         return {"error": "Census API key is not configured in the environment."}
 
+    cache_key = str((*_request_key_parts(request_config), target_year))
+    if DEMOGRAPHIC_CACHE_SIZE > 0:
+        cached_rows = _get_cached_demographic_data(cache_key)
+        if cached_rows is not None:
+            return cached_rows
+
     try:
         _, data = await _fetch_year_data(request_config, target_year)
+        if data and DEMOGRAPHIC_CACHE_SIZE > 0:
+            _store_demographic_data(cache_key, data)
         return data
     except Exception as exc:
         return {"error": f"Error calling Census API: {exc}"}
@@ -533,8 +583,8 @@ async def get_demographic_time_series(
         return copy.deepcopy(cached)
 
     years = list(range(start, end + 1))
-    tasks = [_fetch_year_data(request_config, year) for year in years]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    client = CensusAPIClient()
+    results = await client.get_acs5_data_many([_acs_request(request_config, year) for year in years])
 
     aggregated_rows: List[Dict[str, Any]] = []
     series_map: Dict[str, Dict[str, Any]] = {}
@@ -542,14 +592,13 @@ async def get_demographic_time_series(
     missing_years: List[int] = []
     error_messages: List[str] = []
 
-    for index, result in enumerate(results):
-        year = years[index]
+    for result_year, result in zip(years, results):
         if isinstance(result, Exception):
-            missing_years.append(year)
-            error_messages.append(f"Year {year}: {result}")
+            missing_years.append(result_year)
+            error_messages.append(f"Year {result_year}: {result}")
             continue
 
-        result_year, year_data = result
+        year_data = _enrich_year_data(request_config, result)
         if not year_data:
             missing_years.append(result_year)
             continue
@@ -627,6 +676,29 @@ async def get_demographic_time_series(
     return copy.deepcopy(result)
 
 
+def _summarize_values(values: List[Tuple[float, str]]) -> Optional[Dict[str, Any]]:
+    if not values:
+        return None
+
+    numeric_values = [value for value, _ in values]
+    # fmean works on floats directly; statistics.mean converts every value to an exact
+    # fraction first, which dominates the cost on large results.
+    mean = statistics.fmean(numeric_values)
+    median = statistics.median(numeric_values)
+    min_index = min(range(len(numeric_values)), key=numeric_values.__getitem__)
+    max_index = max(range(len(numeric_values)), key=numeric_values.__getitem__)
+
+    return {
+        "mean": round(mean, 2),
+        "median": round(median, 2),
+        "min": round(numeric_values[min_index], 2),
+        "max": round(numeric_values[max_index], 2),
+        "count": len(values),
+        "min_entity_name": values[min_index][1],
+        "max_entity_name": values[max_index][1],
+    }
+
+
 def calculate_summary_statistics(data: List[Dict[str, Any]], variable_id: str) -> Optional[Dict[str, Any]]:
     """Calculates summary stats for a given variable in the dataset."""
 
@@ -636,24 +708,54 @@ def calculate_summary_statistics(data: List[Dict[str, Any]], variable_id: str) -
         if value is not None:
             values.append((value, row.get("NAME", "N/A")))
 
-    if not values:
-        return None
+    return _summarize_values(values)
 
-    numeric_values = [value for value, _ in values]
-    import statistics
 
-    mean = statistics.mean(numeric_values)
-    median = statistics.median(numeric_values)
-    min_value = min(values, key=lambda item: item[0])
-    max_value = max(values, key=lambda item: item[0])
+def extract_numeric_columns(data: List[Dict[str, Any]], variable_ids: List[str]) -> Dict[str, List[Optional[float]]]:
+    """Parse the requested variables once into per-variable columns aligned with ``data``.
 
-    return {
-        "mean": round(mean, 2),
-        "median": round(median, 2),
-        "min": round(min_value[0], 2),
-        "max": round(max_value[0], 2),
-        "count": len(values),
-        "min_entity_name": min_value[1],
-        "max_entity_name": max_value[1],
-    }
+    Unparseable or missing cells become None so every column keeps the row order.
+    """
+
+    columns: Dict[str, List[Optional[float]]] = {variable_id: [] for variable_id in variable_ids}
+    for row in data:
+        for variable_id, column in columns.items():
+            column.append(_safe_float(row.get(variable_id)))
+    return columns
+
+
+def summarize_numeric_columns(columns: Dict[str, List[Optional[float]]], names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Calculates summary stats for columns produced by extract_numeric_columns."""
+
+    summaries: Dict[str, Dict[str, Any]] = {}
+    for variable_id, column in columns.items():
+        values = [(value, names[index]) for index, value in enumerate(column) if value is not None]
+        stats = _summarize_values(values)
+        if stats:
+            summaries[variable_id] = stats
+    return summaries
+
+
+def calculate_class_breaks(values: List[Optional[float]], class_count: int = 5) -> List[float]:
+    """Quantile break points for a choropleth legend, ignoring missing values.
+
+    Returns ``class_count - 1`` ascending cut points, or an empty list when there are
+    too few values to classify.
+    """
+
+    numeric_values = [value for value in values if value is not None]
+    if class_count < 2 or len(numeric_values) < 2:
+        return []
+
+    breaks = statistics.quantiles(numeric_values, n=class_count, method="inclusive")
+    return [round(value, 2) for value in breaks]
+
+
+def calculate_summary_statistics_batch(data: List[Dict[str, Any]], variable_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Calculates summary stats for several variables in a single pass over the dataset.
+
+    Variables without any numeric values are omitted from the result.
+    """
 
+    names = [row.get("NAME", "N/A") for row in data]
+    return summarize_numeric_columns(extract_numeric_columns(data, variable_ids), names)